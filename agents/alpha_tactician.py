@@ -3,6 +3,7 @@ import colorama
 from colorama import Fore
 import pandas as pd
 import time
+from config.settings import Config
 from agents.warrant_agent import WarrantAgent # 引入權證軍師
 
 colorama.init(autoreset=True)
@@ -17,9 +18,11 @@ class AlphaTactician:
         self.portfolio_agent = portfolio_agent
         self.warrant_agent = WarrantAgent() # 實例化權證軍師
 
-    def generate_daily_tactics(self):
+    def generate_daily_tactics(self, deadline=None):
         """
         核心函數：生成今日最佳戰術指令 (含 Top 15 迴圈審核 & 雙向獵殺)
+        deadline: 掃描時間預算 (秒數或 datetime，預設 Config.TACTICS_SCAN_BUDGET)
+        掃描依 Hunter 熱度排序並串流進行，第一批結果出爐就開始讓投資長審核
         """
         print(f"{Fore.CYAN}[Tactician] 正在召集所有 Agent 進行戰略會議...")
         
@@ -33,102 +36,112 @@ class AlphaTactician:
         hunt_mode = "conservative" if m_score < -1.5 else "aggressive"
         dynamic_list = self.hunter.hunt(mode=hunt_mode)
         
-        # 臨時替換掃描清單
-        original_targets = self.scanner.target_stocks
-        self.scanner.target_stocks = dynamic_list
-        
+        # 熱度越高越先掃 (Hunter 的候選排名表)
+        table = getattr(self.hunter, "last_table", None)
+        heat = table['heat'].to_dict() if table is not None and not table.empty else None
+
         # 執行 AI 掃描 (這裡會自動用 fetch_data(force_update=True) 抓即時價)
-        df_res = self.scanner.scan(strategy="Wolf_Pack")
-        
-        # 還原清單
-        self.scanner.target_stocks = original_targets
-        
-        if df_res.empty:
-            return self._create_empty_report(m_score, m_msg, cash, "全市場掃描完成，無符合 AI 高波動標準之標的。")
+        # 串流模式：掃描在背景繼續跑，這裡邊收結果邊審核
+        stream = self.scanner.scan_iter(
+            dynamic_list, deadline=deadline if deadline is not None else Config.TACTICS_SCAN_BUDGET, priority=heat
+        )
 
         # --- 3. 迴圈審核機制 (Deep Search) ---
-        # 擴大搜索範圍至前 15 名 (按絕對波動排序)
+        # 最多審核 15 檔 (依出爐順序：熱度高的先掃，先出爐的先審)
         search_limit = 15
-        candidates = df_res.head(search_limit)
-        
-        print(f"{Fore.YELLOW}[Tactician] 啟動投資長深度審核 (檢查 Top {search_limit})...")
-        
-        for i, (index, row) in enumerate(candidates.iterrows()):
-            stock_id = row['stock_id']
-            roi = row['ai_roi_pct']
-            price = row['price']
-            support = row['ai_support']
-            target = row['ai_target']
-            direction = row.get('direction', 'NEUTRAL') # 獲取方向
-            score = row['score']
-            rank = i + 1
-            
-            # [關鍵修復] 只要絕對波動 > 1.5%，不管是漲是跌，都有肉吃
-            if abs(roi) < 1.5:
-                print(f" -> [#{rank}] {stock_id} (ROI {roi:.2f}%) 波動過小，略過。")
-                continue
+        found = 0
+        
+        print(f"{Fore.YELLOW}[Tactician] 啟動投資長深度審核 (最多 {search_limit} 檔，邊掃描邊審核)...")
+        
+        try:
+            for row, _ in stream:
+                found += 1
+                if found > search_limit: break
+                decision = self._review(row, found, search_limit, m_score, m_msg, p_data, cash)
+                if decision: return decision
+        finally:
+            stream.close()
 
-            print(f"{Fore.CYAN} -> [#{rank}/{search_limit}] 正在讓投資長審核: {stock_id} ({direction} | ROI {roi:.2f}%) ...")
-
-            # 準備深度資料
-            tech_data = (price, target, support)
-            
-            # [關鍵升級] 呼叫 WarrantAgent 產生精確戰術
-            warrant_plan = self.warrant_agent.generate_plan(price, target, support, score)
-            
-            # 把 direction 補進去，方便 StrategyAgent 判讀
-            warrant_plan['direction'] = direction
-
-            # 請 Gemini 投資長決策
-            final_decision = self.strategy_agent.consult(
-                stock_id,
-                tech_data,
-                warrant_plan,
-                (m_score, m_msg),
-                p_data
-            )
-            
-            # --- API 保護機制 ---
-            time.sleep(1) 
-            
-            # --- 4. 故障安全與判讀 ---
-            if "AI_ERROR" in final_decision:
-                print(f"{Fore.RED}[Tactician] 投資長連線異常，跳過 {stock_id}")
-                continue
-
-            # 清理文字並比對否決關鍵字
-            clean_decision = final_decision.replace(" ", "").replace("\n", "").replace("*", "")
-            # 狼性版本：對「觀望」的容忍度降低，但若投資長說「放棄」還是要聽
-            veto_keywords = ["決策：放棄", "決策:放棄", "風險過高，不建議", "建議空手"]
-            
-            is_vetoed = any(k in clean_decision for k in veto_keywords)
-            
-            if not is_vetoed:
-                # 找到真命天子了！
-                print(f"{Fore.GREEN}[Tactician] 投資長核准！鎖定標的: {stock_id}")
-                return {
-                    "status": "ACTION",
-                    "stock_id": stock_id,
-                    "price": price,
-                    "roi": roi,
-                    "support": support,
-                    "macro_score": m_score,
-                    "macro_msg": m_msg,
-                    "cash": cash,
-                    "gemini_analysis": final_decision,
-                    "ai_target": target,
-                    "direction": direction,
-                    "warrant_plan": warrant_plan # 回傳完整權證計畫
-                }
-            else:
-                print(f"{Fore.RED}[Tactician] 投資長否決 {stock_id}，繼續尋找...")
+        if not found:
+            return self._create_empty_report(m_score, m_msg, cash, "全市場掃描完成，無符合 AI 高波動標準之標的。")
 
         # --- 5. 全軍覆沒 ---
         return self._create_empty_report(
             m_score, m_msg, cash, 
-            f"已深度審核今日最佳的 {search_limit} 檔標的，但全數被投資長否決。建議保留現金。"
+            f"已深度審核今日最佳的 {min(found, search_limit)} 檔標的，但全數被投資長否決。建議保留現金。"
         )
 
+    def _review(self, row, rank, search_limit, m_score, m_msg, p_data, cash):
+        """單一候選交給投資長審核；核准回傳 ACTION 報告，否則回傳 None"""
+        stock_id = row['stock_id']
+        roi = row['ai_roi_pct']
+        price = row['price']
+        support = row['ai_support']
+        target = row['ai_target']
+        direction = row.get('direction', 'NEUTRAL') # 獲取方向
+        score = row['score']
+        
+        # [關鍵修復] 只要絕對波動 > 1.5%，不管是漲是跌，都有肉吃
+        if abs(roi) < 1.5:
+            print(f" -> [#{rank}] {stock_id} (ROI {roi:.2f}%) 波動過小，略過。")
+            return None
+
+        print(f"{Fore.CYAN} -> [#{rank}/{search_limit}] 正在讓投資長審核: {stock_id} ({direction} | ROI {roi:.2f}%) ...")
+
+        # 準備深度資料
+        tech_data = (price, target, support)
+        
+        # [關鍵升級] 呼叫 WarrantAgent 產生精確戰術
+        warrant_plan = self.warrant_agent.generate_plan(price, target, support, score)
+        
+        # 把 direction 補進去，方便 StrategyAgent 判讀
+        warrant_plan['direction'] = direction
+
+        # 請 Gemini 投資長決策
+        final_decision = self.strategy_agent.consult(
+            stock_id,
+            tech_data,
+            warrant_plan,
+            (m_score, m_msg),
+            p_data
+        )
+        
+        # --- API 保護機制 ---
+        time.sleep(1) 
+        
+        # --- 4. 故障安全與判讀 ---
+        if "AI_ERROR" in final_decision:
+            print(f"{Fore.RED}[Tactician] 投資長連線異常，跳過 {stock_id}")
+            return None
+
+        # 清理文字並比對否決關鍵字
+        clean_decision = final_decision.replace(" ", "").replace("\n", "").replace("*", "")
+        # 狼性版本：對「觀望」的容忍度降低，但若投資長說「放棄」還是要聽
+        veto_keywords = ["決策：放棄", "決策:放棄", "風險過高，不建議", "建議空手"]
+        
+        is_vetoed = any(k in clean_decision for k in veto_keywords)
+        
+        if not is_vetoed:
+            # 找到真命天子了！
+            print(f"{Fore.GREEN}[Tactician] 投資長核准！鎖定標的: {stock_id}")
+            return {
+                "status": "ACTION",
+                "stock_id": stock_id,
+                "price": price,
+                "roi": roi,
+                "support": support,
+                "macro_score": m_score,
+                "macro_msg": m_msg,
+                "cash": cash,
+                "gemini_analysis": final_decision,
+                "ai_target": target,
+                "direction": direction,
+                "warrant_plan": warrant_plan # 回傳完整權證計畫
+            }
+
+        print(f"{Fore.RED}[Tactician] 投資長否決 {stock_id}，繼續尋找...")
+        return None
+
     def _create_empty_report(self, m_score, m_msg, cash, reason):
         return {
             "status": "WAIT",
@@ -153,7 +166,7 @@ class AlphaTactician:
         
         if df is None: return "無法獲取持股數據"
         
-        score, msg, (curr, target, support) = self.tech_agent.analyze(df)
+        score, msg, (curr, target, support) = self.tech_agent.analyze_many({old_stock_id: df})[old_stock_id]
         # 計算舊股的「剩餘」漲幅潛力
         new_roi = (target - curr) / curr * 100
         
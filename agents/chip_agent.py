@@ -1,6 +1,7 @@
 import pandas as pd
 from datetime import date, timedelta
-from FinMind.data import DataLoader as FinMindDataLoader
+from utils.finmind_gateway import get_finmind
+from utils.data_loader import DataLoader
 from config.settings import Config
 import colorama
 from colorama import Fore
@@ -8,26 +9,36 @@ from colorama import Fore
 colorama.init(autoreset=True)
 
 class ChipAgent:
-    def __init__(self):
-        self.api = FinMindDataLoader()
-        self.api.login(user_id=Config.FINMIND_USER, password=Config.FINMIND_PASS)
+    def __init__(self, loader=None):
+        # 共用 FinMind gateway (單一登入 + 限流 + 用量統計)
+        self.api = get_finmind()
+        # 融資融券走 DataLoader 的批次匯入 + 本地 DB，不再每檔即時呼叫 API
+        self.loader = loader or DataLoader()
 
     def analyze(self, df):
-        # df 已經包含了基本的 Foreign_BuySell (來自 data_loader)
-        # 但我們需要額外去抓「融資融券」數據，因為 data_loader 預設沒抓這個
-        
-        print(f"{Fore.CYAN}[Chip Agent] 正在進行深度籌碼透視 (法人 vs 散戶)...")
-        
         stock_id = str(df['stock_id'].iloc[-1])
-        today_str = date.today().strftime('%Y-%m-%d')
-        start_date = (date.today() - timedelta(days=10)).strftime('%Y-%m-%d')
-        
-        # 1. 抓取融資融券 (Margin)
-        df_margin = self.api.taiwan_stock_margin_purchase_short_sale(
-            stock_id=stock_id, start_date=start_date, end_date=today_str
-        )
-        
-        # 2. 基礎法人數據 (來自輸入的 df)
+        return self.analyze_many({stock_id: df})[stock_id]
+
+    def analyze_many(self, dfs, refresh=True):
+        """
+        dfs: {stock_id: 日K df (含 Foreign_BuySell / Trust_BuySell)} -> {stock_id: (score, msg)}
+        融資融券先增量匯入 (已是最新就不打 API)，再以一個查詢讀出整份名單
+        """
+        stock_ids = [str(s) for s in dfs]
+        print(f"{Fore.CYAN}[Chip Agent] 正在進行深度籌碼透視 (法人 vs 散戶)，共 {len(stock_ids)} 檔...")
+
+        if refresh:
+            self.loader.refresh_margin(stock_ids)
+        since = (date.today() - timedelta(days=Config.MARGIN_LOOKBACK_DAYS)).strftime('%Y-%m-%d')
+        margins = self.loader.db.split_many(self.loader.db.load_margin(stock_ids, since))
+
+        return {
+            stock_id: self._score(df, margins.get(str(stock_id), pd.DataFrame()))
+            for stock_id, df in dfs.items()
+        }
+
+    def _score(self, df, df_margin):
+        # 1. 基礎法人數據 (來自輸入的 df，單位：張)
         recent = df.tail(5)
         foreign_sum = recent['Foreign_BuySell'].sum()
         trust_sum = recent['Trust_BuySell'].sum()
@@ -74,4 +85,4 @@ class ChipAgent:
 
         # 綜合判斷
         msg = f"籌碼結構: {' '.join(status)}"
-        return score, msg
\ No newline at end of file
+        return score, msg
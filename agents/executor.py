@@ -1,5 +1,7 @@
 import numpy as np
 from config.settings import Config
+from utils.features import atr as compute_atr
+from agents.risk_mgr import RiskManager
 import colorama
 from colorama import Fore
 
@@ -8,10 +10,12 @@ colorama.init(autoreset=True)
 class Executor:
     def __init__(self, capital=120000): # 預設本金 12 萬
         self.capital = capital
+        self.risk = RiskManager()
 
-    def plan_trade(self, df, tft_data, total_score, risk_safe):
+    def plan_trade(self, df, tft_data, total_score, risk_safe, atr=None):
         """
         根據分析結果，生成具體的交易計畫
+        atr: 呼叫端已整批算好的 ATR，未提供時由 df 計算
         """
         current_price = df['Close'].iloc[-1]
         
@@ -38,19 +42,21 @@ class Executor:
             }
 
         # 2. 計算進出場點位 (精密戰術)
+        if atr is None: atr = compute_atr(df)
+        has_atr = np.isfinite(atr) and atr > 0
         if direction == "LONG":
             # 進場：不要追高，掛在 TFT 預測的中軸與下緣之間
             entry_price = (current_price + p10) / 2
-            # 停損：跌破 TFT 預測的下緣 (P10) 再多讓 1%
-            stop_loss = p10 * 0.99
+            # 停損：進場價下方 ATR_MULTIPLIER 個 ATR (算不出 ATR 時退回 TFT 下緣 P10 再多讓 1%)
+            stop_loss = self.risk.stop_price(entry_price, atr, direction) if has_atr else p10 * 0.99
             # 停利：TFT 預測的上緣 (P90)
             take_profit = p90
             
         elif direction == "SHORT":
             # 進場：掛在現價與壓力 (P90) 之間
             entry_price = (current_price + p90) / 2
-            # 停損：突破壓力位 (P90) 再多讓 1%
-            stop_loss = p90 * 1.01
+            # 停損：進場價上方 ATR_MULTIPLIER 個 ATR (算不出 ATR 時退回壓力位 P90 再多讓 1%)
+            stop_loss = self.risk.stop_price(entry_price, atr, direction) if has_atr else p90 * 1.01
             # 停利：TFT 預測的下緣 (P10)
             take_profit = p10
 
@@ -1,7 +1,6 @@
 import pandas as pd
 from datetime import date, timedelta
-from FinMind.data import DataLoader as FinMindDataLoader
-from config.settings import Config
+from utils.finmind_gateway import get_finmind
 import colorama
 from colorama import Fore
 
@@ -9,8 +8,8 @@ colorama.init(autoreset=True)
 
 class FundamentalAgent:
     def __init__(self):
-        self.api = FinMindDataLoader()
-        self.api.login(user_id=Config.FINMIND_USER, password=Config.FINMIND_PASS)
+        # 共用 FinMind gateway (單一登入 + 限流 + 用量統計)
+        self.api = get_finmind()
 
     def analyze(self, stock_id):
         print(f"{Fore.BLUE}[Fundamental Agent] 正在審計 {stock_id} 財務報表...")
@@ -1,87 +1,187 @@
 # agents/hunter.py
+import time
+import threading
 import requests
 import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import Config
 import colorama
 from colorama import Fore
-from bs4 import BeautifulSoup
-import re
+from utils.html_extract import quote_links
+from utils.symbol_index import get_symbol_index
+from utils.realtime_quote import get_quote_service
+from datetime import date, timedelta
 
 colorama.init(autoreset=True)
 
 class HunterAgent:
+    # 排行榜解析結果 (rank_type, exchange) -> (抓取時間, 依名次排序的代號清單)
+    # 放在類別層級：Dashboard、獵人分頁、AlphaTactician 數分鐘內重複呼叫都共用同一份
+    _rank_cache = {}
+    _cache_lock = threading.Lock()
+
     def __init__(self):
         # Yahoo 股市排行的基礎 URL
         self.base_url = "https://tw.stock.yahoo.com/rank/{type}?exchange={exchange}"
+        self.T86_URL = "https://www.twse.com.tw/rwd/zh/fund/T86"
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
+        self.timeout = (3, 10) # (連線, 讀取) 秒
+        # 長連線池 + 限流/5xx 自動重試 (指數退避)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=["GET"])
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=8)
+        self.session.mount("https://", adapter)
+        self.symbols = get_symbol_index()
+        self.last_table = None # 最近一次 hunt 的候選排名表
+
+    def _cached(self, key, loader):
+        """HUNTER_CACHE_TTL 秒內直接回傳快取；loader 失敗 (回傳 None) 時不寫入快取"""
+        with self._cache_lock:
+            hit = self._rank_cache.get(key)
+        if hit and time.monotonic() - hit[0] < Config.HUNTER_CACHE_TTL:
+            return list(hit[1])
+        result = loader()
+        if result is None: return []
+        with self._cache_lock:
+            self._rank_cache[key] = (time.monotonic(), result)
+        return list(result)
 
     def _fetch_rank(self, rank_type, exchange="TAI"):
         """
-        抓取排行榜
+        抓取 Yahoo 排行榜 (依名次排序的完整清單，前 N 名由呼叫端決定)
         rank_type: 'volume' (成交量), 'change-up' (漲幅), 'turnover-ratio' (周轉率)
         exchange: 'TAI' (上市), 'TWO' (上櫃)
         """
-        url = self.base_url.format(type=rank_type, exchange=exchange)
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-        except Exception as e:
-            print(f"{Fore.RED}[Hunter] 連線失敗: {e}")
-            return []
+        def load():
+            url = self.base_url.format(type=rank_type, exchange=exchange)
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+            except Exception as e:
+                print(f"{Fore.RED}[Hunter] 連線失敗 ({rank_type}/{exchange}): {e}")
+                return None
 
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 解析股票代號 (Yahoo 的結構可能會變，這裡用通用的 class 抓取)
-        # 通常股票代號會在一個帶有 ticker 連結的結構中
-        stocks = []
-        
-        # 針對 Yahoo 股市新版介面的解析邏輯
-        # 尋找所有類似 /quote/2330.TW 的連結
-        links = soup.find_all('a', href=re.compile(r'/quote/\d+\.(TW|TWO)'))
-        
-        for link in links:
-            href = link.get('href')
-            # 提取代號，例如 /quote/2330.TW -> 2330
-            match = re.search(r'(\d+)\.(TW|TWO)', href)
-            if match:
-                stock_id = match.group(1)
+            # 解析股票代號：只掃描 /quote/2330.TW 這類連結 (輕量正規式，不建 DOM)
+            stocks = []
+            for stock_id, suffix in quote_links(response.text):
                 # 簡單過濾：排除權證 (6位數) 或特殊商品，只留個股 (4位數)
-                if len(stock_id) == 4: 
+                if len(stock_id) == 4:
                     stocks.append(stock_id)
-        
-        # 去除重複並保持順序
-        seen = set()
-        unique_stocks = [x for x in stocks if not (x in seen or seen.add(x))]
-        
-        return unique_stocks[:30] # 每個榜單只抓前 30 名，求精不求多
+                    # 排行榜連結本身就帶交易所，順手回填代號對照表
+                    self.symbols.remember(stock_id, suffix)
+            # 去除重複並保持順序
+            return list(dict.fromkeys(stocks))
+        return self._cached((rank_type, exchange), load)
+
+    def _fetch_foreign_net_buy(self):
+        """證交所三大法人買賣超日報 (T86)：外資買超由大到小；盤中尚未公布時往回找最近一個交易日"""
+        def load():
+            day = date.today()
+            for _ in range(5):
+                try:
+                    res = self.session.get(self.T86_URL, timeout=self.timeout, params={
+                        "date": day.strftime("%Y%m%d"), "selectType": "ALLBUT0999", "response": "json",
+                    })
+                    payload = res.json()
+                except Exception:
+                    payload = {}
+                if payload.get("stat") == "OK" and payload.get("data"):
+                    fields = payload["fields"]
+                    col = next(i for i, f in enumerate(fields) if "外陸資買賣超" in f)
+                    rows = []
+                    for row in payload["data"]:
+                        stock_id = str(row[0]).strip()
+                        if len(stock_id) != 4: continue
+                        try: net = float(str(row[col]).replace(",", ""))
+                        except ValueError: continue
+                        if net > 0: rows.append((net, stock_id))
+                    rows.sort(reverse=True)
+                    return [stock_id for _, stock_id in rows]
+                day -= timedelta(days=1)
+            print(f"{Fore.RED}[Hunter] 外資買超資料取得失敗")
+            return None
+        return self._cached(("foreign-net-buy", "TAI"), load)
+
+    # --- 候選來源 (可插拔)：每個來源回傳數個「依名次排序的清單」，各清單分開計分 ---
+    def _source_yahoo(self, spec):
+        keys = [(spec["rank_type"], exchange) for exchange in spec.get("exchanges", ("TAI", "TWO"))]
+        with ThreadPoolExecutor(max_workers=len(keys)) as pool:
+            return list(pool.map(lambda key: self._fetch_rank(*key), keys))
+
+    def _source_foreign_net_buy(self, spec):
+        return [self._fetch_foreign_net_buy()]
+
+    def _source_limit_up(self, spec):
+        """漲幅榜前段再用 MIS 即時報價確認是否已鎖漲停"""
+        lists = self._source_yahoo({"rank_type": "change-up", "exchanges": spec.get("exchanges", ("TAI", "TWO"))})
+        quotes = get_quote_service()
+        return [quotes.limit_up(ids[:spec.get("top", Config.HUNTER_TOP_N)]) for ids in lists]
+
+    def _collect(self, name):
+        spec = Config.HUNTER_SOURCES[name]
+        fetch = getattr(self, f"_source_{spec.get('fetch', 'yahoo')}")
+        try:
+            lists = fetch(spec)
+        except Exception as e:
+            print(f"{Fore.RED}[Hunter] 來源 {name} 失敗: {e}")
+            lists = []
+        top = spec.get("top", Config.HUNTER_TOP_N)
+        return [ids[:top] for ids in lists if ids]
+
+    def hunt_table(self, mode="aggressive"):
+        """
+        候選排名表 (index = stock_id，依 heat 由高到低)
+        rank_<來源>: 在該來源的名次 (來源名即 HUNTER_SOURCES 的 key，例如 rank_change_up) (1 起算，上市/上櫃各自排名；沒上榜為 NaN)
+        n_lists: 出現在幾個來源；heat: 各來源 weight x (1 - (名次-1)/榜長) 的加總
+        """
+        names = Config.HUNTER_MODES.get(mode, Config.HUNTER_MODES["aggressive"])
+        print(f"{Fore.YELLOW} -> 併發掃描 {len(names)} 個來源: {', '.join(names)}")
+        with ThreadPoolExecutor(max_workers=len(names)) as pool:
+            collected = dict(zip(names, pool.map(self._collect, names)))
+
+        # 同一來源上市/上櫃兩個榜都出現的 (理論上不會) 取較好的名次
+        best = {}
+        for name, lists in collected.items():
+            for ids in lists:
+                for rank, stock_id in enumerate(ids, start=1):
+                    key = (stock_id, name)
+                    if key not in best or rank < best[key][0]: best[key] = (rank, len(ids))
+
+        rows = {}
+        for (stock_id, name), (rank, length) in best.items():
+            row = rows.setdefault(stock_id, {"heat": 0.0})
+            row[f"rank_{name}"] = rank
+            row["heat"] += Config.HUNTER_SOURCES[name].get("weight", 1.0) * (1 - (rank - 1) / length)
+
+        columns = [f"rank_{name}" for name in names] + ["n_lists", "heat", "exchange"]
+        if not rows:
+            return pd.DataFrame(columns=columns).rename_axis("stock_id")
+
+        table = pd.DataFrame.from_dict(rows, orient="index")
+        table = table.reindex(columns=[f"rank_{name}" for name in names] + ["heat"])
+        table["n_lists"] = table[[f"rank_{name}" for name in names]].notna().sum(axis=1)
+        table["exchange"] = [self.symbols.exchange(stock_id) for stock_id in table.index]
+        table = table.sort_values(["heat", "n_lists"], ascending=False, kind="mergesort")
+        return table[columns].rename_axis("stock_id")
 
     def hunt(self, mode="aggressive"):
         """
-        開始狩獵：整合上市上櫃的強勢股
-        mode:
-         - aggressive: 抓漲幅排行 + 成交量排行 (適合找飆股)
-         - conservative: 抓成交量排行 (適合找權值股)
+        開始狩獵：整合上市上櫃的強勢股，回傳依熱度排序的代號清單
+        mode (來源組合見 Config.HUNTER_MODES):
+         - aggressive: 成交量 + 漲幅 + 周轉率 + 外資買超 + 漲停 (適合找飆股)
+         - conservative: 只看成交量 (適合找權值股)
+         - institutional: 成交量 + 外資買超 (跟著法人資金)
+        完整排名表存在 self.last_table
         """
         print(f"{Fore.RED}🦅 [Hunter Agent] 鷹眼啟動，正在掃描全台股異動...")
-        
-        targets = set()
-        
-        # 1. 上市 + 上櫃 成交量排行 (資金熱點)
-        print(f"{Fore.YELLOW} -> 掃描資金熱點 (上市/上櫃 成交量)...")
-        targets.update(self._fetch_rank("volume", "TAI"))
-        targets.update(self._fetch_rank("volume", "TWO"))
-        
-        if mode == "aggressive":
-            # 2. 上市 + 上櫃 漲幅排行 (強勢飆股)
-            print(f"{Fore.YELLOW} -> 鎖定強勢飆股 (上市/上櫃 漲幅榜)...")
-            targets.update(self._fetch_rank("change-up", "TAI"))
-            targets.update(self._fetch_rank("change-up", "TWO"))
-            
-            # 3. 選擇性：周轉率 (代表有人在炒)
-            # targets.update(self._fetch_rank("turnover-ratio", "TAI"))
-
-        target_list = list(targets)
+        table = self.hunt_table(mode)
+        self.last_table = table
+        target_list = list(table.index)
         print(f"{Fore.GREEN}🦅 [Hunter] 狩獵完成！共鎖定 {len(target_list)} 檔異動標的。")
         
         return target_list
@@ -89,4 +189,4 @@ class HunterAgent:
 # 簡單測試用
 if __name__ == "__main__":
     hunter = HunterAgent()
-    print(hunter.hunt())
\ No newline at end of file
+    print(hunter.hunt_table())
@@ -22,6 +22,8 @@ class PositionMonitor:
 
         report = []
         print(f"{Fore.CYAN}[Monitor] 正在巡視 {len(positions)} 檔持倉狀態...")
+        # 先整批補齊全市場日K，逐檔更新時只剩盤中即時價
+        self.loader.refresh_market()
 
         for pos in positions:
             stock_id = pos['stock_id']
@@ -24,8 +24,13 @@ class ReviewAgent:
         daily_stats = []
         
         print(f"{Fore.YELLOW}[Review] 重新掃描 {len(targets)} 檔標的之收盤數據...")
-        for stock_id in targets:
-            df = self.loader.fetch_data(stock_id, force_update=True)
+        # 收盤後先以全市場單日行情整批補檔，再一次批次讀出快取 (增量多半已無需請求)
+        self.loader.refresh_market()
+        # 盤後批次工作：觀察名單的法人買賣超、融資融券一併補齊
+        self.loader.refresh_flows(targets)
+        self.loader.refresh_margin(targets)
+        frames = self.loader.fetch_many(targets, force_update=True)
+        for stock_id, df in frames.items():
             if df is None or len(df) < 2: continue
             
             close = df['Close'].iloc[-1]
@@ -74,13 +79,14 @@ class ReviewAgent:
             report.append("今日市場波動平緩，無顯著異動標的需檢討。")
         else:
             # 取前 3 名波動最大的進行檢討
-            for _, row in significant_moves.head(3).iterrows():
+            top_moves = significant_moves.head(3)
+            # --- 關鍵差異：重新進行技術面評估 (Re-Evaluate)，一次批次推論 ---
+            analyses = self.tech_agent.analyze_many({row['stock_id']: row['df'] for _, row in top_moves.iterrows()})
+            for _, row in top_moves.iterrows():
                 sid = row['stock_id']
                 change = row['pct_change']
-                df = row['df']
                 
-                # --- 關鍵差異：重新進行技術面評估 (Re-Evaluate) ---
-                score, msg, (curr, target, support) = self.tech_agent.analyze(df)
+                score, msg, (curr, target, support) = analyses[sid]
                 new_roi = (target - curr) / curr * 100
                 
                 status = "🔴 錯失" if sid != rec_stock and change > 0 else ("🟢 命中" if sid == rec_stock else "🛡️ 避開")
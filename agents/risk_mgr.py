@@ -3,24 +3,34 @@ import numpy as np
 import colorama
 from colorama import Fore
 from config.settings import Config
+from utils.features import atr as compute_atr
 
 colorama.init(autoreset=True)
 
 class RiskManager:
-    def check_risk(self, df, strategy_score):
+    def check_risk(self, df, strategy_score, atr=None):
+        """atr: 呼叫端已用 atr_many 整批算好的 ATR，未提供時由 df 計算"""
         print(f"{Fore.MAGENTA}[Risk Manager] 正在進行壓力測試與風控...")
         
         close = df['Close']
         
-        # 1. 波動率檢查 (ATR 概念简化版: 近5日高低震幅平均)
-        # 如果你有 high/low 數據更好，這裡用收盤價變化率模擬
-        volatility = close.pct_change().tail(5).std()
+        # 1. 波動率檢查 (ATR：含跳空與盤中高低的真實波幅，已還原除權息)
+        if atr is None: atr = compute_atr(df)
+        volatility = atr / close.iloc[-1]
         
-        # 台積電平常波動約 1.5%，如果 > 2.5% 代表市場恐慌
-        limit = 0.025
+        # 台積電平常 ATR 約 2%，超過 ATR_PCT_LIMIT 代表市場恐慌
+        limit = Config.ATR_PCT_LIMIT
+        label = "ATR"
+        if not np.isfinite(volatility):
+            # 歷史太短算不出 ATR：退回舊的近 5 日報酬率標準差 (門檻 2.5%)
+            volatility = close.pct_change().tail(5).std()
+            limit = 0.025
+            label = "Vol"
+            if not np.isfinite(volatility):
+                return False, f"{Fore.RED}❌ 警告：資料不足以評估波動，強制鎖單！"
         
         if volatility > limit:
-            msg = f"{Fore.RED}❌ 警告：市場波動劇烈 (Vol: {volatility*100:.2f}%) > {limit*100}%，強制鎖單！"
+            msg = f"{Fore.RED}❌ 警告：市場波動劇烈 ({label}: {volatility*100:.2f}%) > {limit*100}%，強制鎖單！"
             return False, msg
             
         # 2. 乖離率 (Bias) 檢查
@@ -39,4 +49,9 @@ class RiskManager:
         # 這裡未來可以接你的券商 API 讀取真實庫存損益
         # 現在先回傳 Pass
         
-        return True, f"{Fore.GREEN}✅ 風控檢測通過 (Vol: {volatility*100:.2f}%, Bias: {bias*100:.2f}%)"
\ No newline at end of file
+        return True, f"{Fore.GREEN}✅ 風控檢測通過 ({label}: {volatility*100:.2f}%, Bias: {bias*100:.2f}%)"
+
+    def stop_price(self, entry, atr, direction="LONG"):
+        """ATR 停損：做多設在進場價下方 ATR_MULTIPLIER 個 ATR，做空在上方"""
+        distance = Config.ATR_MULTIPLIER * atr
+        return entry - distance if direction == "LONG" else entry + distance
\ No newline at end of file
@@ -7,6 +7,10 @@ from agents.tech_agent import TechAgent
 import colorama
 from colorama import Fore
 import time
+import heapq
+import queue
+import threading
+from datetime import datetime
 
 colorama.init(autoreset=True)
 
@@ -26,14 +30,10 @@ class MarketScanner:
             "1513", "1519", "1504", "1605", "0050"
         ]
 
-    def _scan_single_stock(self, stock_id):
+    def _evaluate(self, stock_id, df, analysis):
         try:
-            df = self.loader.fetch_data(stock_id, force_update=True) 
-            if df is None: return None
-            if len(df) < Config.WINDOW_SIZE: return None
-            
             current_price = df['Close'].iloc[-1]
-            score, msg, (curr, target, support) = self.tech_agent.analyze(df)
+            score, msg, (curr, target, support) = analysis
             roi = (target - current_price) / current_price
             
             if abs(roi) > 0.5: return None # 異常數據過濾
@@ -69,14 +69,123 @@ class MarketScanner:
             print(f"{Fore.RED}Error scanning {stock_id}: {e}")
         return None
 
-    def scan(self, strategy="Wolf_Pack"):
+    def _deadline(self, deadline):
+        """deadline 可給秒數 (從現在起算) 或 datetime，統一轉成 time.monotonic() 的時間點"""
+        if deadline is None: return None
+        if isinstance(deadline, datetime):
+            return time.monotonic() + (deadline - datetime.now()).total_seconds()
+        return time.monotonic() + float(deadline)
+
+    def _volatility(self, stock_ids):
+        """DB 中最近 20 日報酬率的標準差 (不打 API)，作為沒有熱度資訊時的優先序"""
+        arrays = self.loader.db.load_many(stock_ids, as_arrays=True)
+        vol = {}
+        for stock_id, cols in arrays.items():
+            close = cols['Close'][-21:].astype(float)
+            if len(close) > 2: vol[stock_id] = float(np.nanstd(np.diff(close) / close[:-1]))
+        return vol
+
+    def _prioritize(self, stock_ids, priority):
+        """
+        priority: None (維持原順序) / "volatility" / {stock_id: 分數} / callable(stock_id) -> 分數
+        分數越高越先掃；沒有分數的排在最後並維持原順序
+        """
+        if priority is None: return list(stock_ids)
+        if isinstance(priority, str) and priority == "volatility":
+            priority = self._volatility(stock_ids)
+        score = priority if callable(priority) else (lambda s: priority.get(s))
+        scored = [(score(s), i, s) for i, s in enumerate(stock_ids)]
+        scored.sort(key=lambda x: (x[0] is None, -(x[0] or 0), x[1]))
+        return [s for _, _, s in scored]
+
+    def _expired(self, end):
+        return end is not None and time.monotonic() > end
+
+    def scan_iter(self, stock_ids=None, workers=None, deadline=None, priority=None, top_k=10, batch_size=None):
+        """
+        串流掃描 (generator)：每檔評分完成就 yield (結果, 目前 Top-K 清單)
+        抓資料 (執行緒池，依優先序送出) 與 TFT 推論在背景並行：推論端把「已經抓好」的標的湊成 micro-batch，
+        第一檔抓好就能出結果，不必等整批；呼叫端處理結果 (LLM 審核、畫面更新) 時掃描照常進行
+        deadline 到了就不再開始新的推論並取消尚未開始的抓取；呼叫端提早結束迭代時背景掃描也會停止
+        Top-K 依絕對預期波動排序 (同分時先出爐者優先)
+        """
+        stock_ids = self._prioritize(list(stock_ids if stock_ids is not None else self.target_stocks), priority)
+        batch_size = batch_size or Config.SCAN_CHUNK_SIZE
+        end = self._deadline(deadline)
+        ready = queue.Queue()
+        out = queue.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def fetch():
+            # 缺少的交易日先以全市場行情整批補齊 (每天一個請求)，之後逐檔增量多半不必再打 API
+            # 法人買賣超同樣只做全市場逐日補 (不在掃描時逐檔回補歷史)
+            try:
+                self.loader.refresh_market()
+                self.loader.refresh_flows(backfill=False)
+            except Exception as e:
+                print(f"{Fore.YELLOW}[Scanner] 全市場補檔失敗，改逐檔增量: {e}")
+            it = self.loader.fetch_iter(stock_ids, force_update=True, workers=workers)
+            try:
+                for item in it:
+                    if stop.is_set() or self._expired(end): break
+                    ready.put(item)
+            except Exception as e:
+                print(f"{Fore.RED}[Scanner] 抓取中斷: {e}")
+            finally:
+                it.close()
+                ready.put(done)
+
+        def infer():
+            finished = False
+            try:
+                while not finished and not stop.is_set():
+                    batch = [ready.get()]
+                    # 把已經抓好的一併帶走，湊成一個 micro-batch
+                    while len(batch) < batch_size:
+                        try: batch.append(ready.get_nowait())
+                        except queue.Empty: break
+                    finished = any(item is done for item in batch)
+                    if self._expired(end):
+                        print(f"{Fore.YELLOW}[Scanner] 時間預算用盡，停止掃描")
+                        break
+                    frames = {}
+                    for item in batch:
+                        if item is done: continue
+                        stock_id, df = item
+                        if df is not None and len(df) >= Config.WINDOW_SIZE: frames[stock_id] = df
+                    if not frames: continue
+                    analyses = self.tech_agent.analyze_many(frames)
+                    for stock_id, df in frames.items():
+                        res = self._evaluate(stock_id, df, analyses[stock_id])
+                        if res: out.put(res)
+            except Exception as e:
+                print(f"{Fore.RED}[Scanner] 掃描中斷: {e}")
+            finally:
+                stop.set()
+                out.put(done)
+
+        threading.Thread(target=fetch, daemon=True).start()
+        threading.Thread(target=infer, daemon=True).start()
+
+        heap = [] # (abs_roi, -序號, 結果) 的 min-heap，只保留 top_k 筆
+        seq = 0
+        try:
+            while True:
+                res = out.get()
+                if res is done: break
+                seq += 1
+                item = (abs(res['ai_roi_pct']), -seq, res)
+                if len(heap) < top_k: heapq.heappush(heap, item)
+                elif item[:2] > heap[0][:2]: heapq.heapreplace(heap, item)
+                top = [r for _, _, r in sorted(heap, key=lambda x: x[:2], reverse=True)]
+                yield res, top
+        finally:
+            stop.set()
+
+    def scan(self, strategy="Wolf_Pack", workers=None, deadline=None, priority=None):
         print(f"{Fore.CYAN}[Scanner] 狼群出動 (Wolf Pack Mode) - 掃描 {len(self.target_stocks)} 檔標的...")
-        results = []
-        for i, stock_id in enumerate(self.target_stocks):
-            res = self._scan_single_stock(stock_id)
-            if res: results.append(res)
-            # 稍微加速，只休 0.1s
-            if i % 10 == 0: time.sleep(0.1) 
+        results = [res for res, _ in self.scan_iter(self.target_stocks, workers, deadline, priority)]
         
         if results:
             res_df = pd.DataFrame(results)
@@ -84,4 +193,4 @@ class MarketScanner:
             res_df['abs_roi'] = res_df['ai_roi_pct'].abs()
             return res_df.sort_values("abs_roi", ascending=False)
         
-        return pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame()
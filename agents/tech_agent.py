@@ -1,33 +1,79 @@
 # agents/tech_agent.py (V12 - Professional Features Match)
 import os
-import numpy as np
 import pandas as pd
 import torch
-import lightning.pytorch as pl
 from pytorch_forecasting import TemporalFusionTransformer, TimeSeriesDataSet
 from pytorch_forecasting.data import GroupNormalizer
 from config.settings import Config
+from utils.inference_engine import TFTInferenceEngine
+from utils.forecast_cache import ForecastCache
+from utils.features import add_features_many, IncrementalFeatureState, FEATURE_COLUMNS
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import timedelta
 import colorama
 from colorama import Fore
 
 colorama.init(autoreset=True)
 
+class ForecastResult:
+    """
+    單次 TFT 推論的完整結果
+    quantiles: (PREDICTION_DAYS, 7) 的分位數矩陣，欄位依序為 2/10/25/50/75/90/98 百分位
+    """
+    def __init__(self, stock_id, score=0, msg="", curr=0, target=0, support=0, quantiles=None, pred_dates=None):
+        self.stock_id = stock_id
+        self.score = score
+        self.msg = msg
+        self.curr = curr
+        self.target = target
+        self.support = support
+        self.quantiles = quantiles
+        self.pred_dates = pred_dates or []
+
+    @property
+    def ok(self):
+        return self.quantiles is not None
+
+    @property
+    def p10(self): return self.quantiles[:, 1]
+
+    @property
+    def p50(self): return self.quantiles[:, 3]
+
+    @property
+    def p90(self): return self.quantiles[:, 5]
+
+    def as_tuple(self):
+        """analyze() 的舊格式: (score, msg, (curr, target, support))"""
+        return self.score, self.msg, (self.curr, self.target, self.support)
+
+    def to_plot_data(self, df):
+        """get_plot_data() 的舊格式"""
+        if not self.ok: return {}
+        return {
+            "hist_dates": df['date'], "hist_close": df['Close'], "pred_dates": self.pred_dates,
+            "p10": self.p10, "p50": self.p50, "p90": self.p90
+        }
+
 class TechAgent:
     def __init__(self):
         self.model_dir = Config.DATA_DIR
-        self.model_path = self._find_best_model()
         self.dataset_path = os.path.join(Config.DATA_DIR, "fitted_dataset.pkl")
+        self.model_path = None
+        self.model_stamp = None
+        self.model_fingerprint = None
         self.model = None
+        self.engine = None
         self.trained_dataset = None 
+        self.cache = ForecastCache() # (stock_id, 最後日期, 收盤, 模型指紋) -> ForecastResult
+        # stock_id -> (昨收 key, 截至昨收的特徵, IncrementalFeatureState)，LRU 上限 FEATURE_STATE_CACHE_SIZE 檔
+        self._feature_states = OrderedDict()
+        self._state_lock = threading.Lock()
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         
-        if self.model_path:
-            try:
-                self.model = TemporalFusionTransformer.load_from_checkpoint(self.model_path)
-                self.model.eval()
-                self.model.to(self.device)
-            except: pass
+        self._load_model(self._find_best_model())
 
         if os.path.exists(self.dataset_path):
             try: self.trained_dataset = torch.load(self.dataset_path, weights_only=False)
@@ -45,59 +91,118 @@ class TechAgent:
         files.sort(key=lambda x: os.path.getmtime(os.path.join(self.model_dir, x)), reverse=True)
         return os.path.join(self.model_dir, files[0])
 
+    def _model_stamp(self, path):
+        return (path, os.path.getmtime(path)) if path else None
+
+    def _fingerprint(self, path):
+        """checkpoint 內容的 SHA1，作為推論快取 key 的一部分"""
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()[:16]
+
+    def _load_model(self, path):
+        self.model_path = path
+        # 載入失敗也記下 stamp，檔案沒變就不會每次推論都重試
+        self.model_stamp = self._model_stamp(path)
+        self.model_fingerprint = None
+        self.model = None
+        self.engine = None
+        if not path: return
+        try:
+            self.model = TemporalFusionTransformer.load_from_checkpoint(path)
+            self.model.eval()
+            self.model.to(self.device)
+            self.engine = TFTInferenceEngine(self.model, self.device)
+            self.model_fingerprint = self._fingerprint(path)
+        except: pass
+
+    def _refresh_model(self):
+        """若訓練產生了新的 .ckpt，自動換上新模型並讓舊的推論快取失效"""
+        try:
+            path = self._find_best_model()
+            stamp = self._model_stamp(path)
+        except OSError:
+            return
+        if stamp == self.model_stamp: return
+        print(f"{Fore.YELLOW}[TechAgent] 偵測到新模型 {path}，重新載入...")
+        self._load_model(path)
+        self.cache.clear()
+
     def _preprocess(self, df, stock_id):
-        data = df.copy()
-        data['date'] = pd.to_datetime(data['date'])
-        min_date = pd.Timestamp(Config.START_DATE)
-        data['time_idx'] = (data['date'] - min_date).dt.days
-        
-        if 'stock_id' not in data.columns: data['stock_id'] = str(stock_id)
-        
+        return self._preprocess_many({str(stock_id): df})[str(stock_id)]
+
+    def _preprocess_many(self, dfs):
+        """
+        特徵計算交給共用特徵引擎 (與 Trainer 同一份程式碼，不會再不一致)
+        盤中只有最後一根 (即時價) 變動時，沿用昨收為止的特徵，最後一根用增量狀態補上
+        """
+        inputs = {}
+        out = {}
+        for stock_id, df in dfs.items():
+            data = df
+            if 'stock_id' not in data.columns:
+                data = df.copy()
+                data['stock_id'] = str(stock_id)
+            row = self._incremental_update(stock_id, data)
+            if row is not None: out[stock_id] = row
+            else: inputs[stock_id] = data
+
         # Proxy 策略: 統一使用 2330，依賴 Normalizer 修正價格
-        data['group_id'] = "2330"
+        full = add_features_many(inputs, group_ids={stock_id: "2330" for stock_id in inputs})
+        for stock_id, data in full.items():
+            self._remember_state(stock_id, inputs[stock_id], data)
+        out.update(full)
+        return out
 
-        data['log_volume'] = np.log1p(data['Volume'])
-        data['pct_change'] = data['Close'].pct_change()
-        
-        for w in [5, 20, 60]:
-            data[f'MA{w}'] = data['Close'].rolling(w).mean()
-            data[f'Bias{w}'] = (data['Close'] - data[f'MA{w}']) / (data[f'MA{w}'] + 1e-9)
-            
-        delta = data['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(6).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(6).mean()
-        rs = gain / (loss + 1e-9)
-        data['RSI6'] = 100 - (100 / (1 + rs))
-        
-        exp12 = data['Close'].ewm(span=12, adjust=False).mean()
-        exp26 = data['Close'].ewm(span=26, adjust=False).mean()
-        data['MACD'] = exp12 - exp26
-        data['MACD_signal'] = data['MACD'].ewm(span=9, adjust=False).mean()
-        data['MACD_hist'] = data['MACD'] - data['MACD_signal']
-        
-        low_min = data['Close'].rolling(9).min()
-        high_max = data['Close'].rolling(9).max()
-        rsv = (data['Close'] - low_min) / (high_max - low_min + 1e-9) * 100
-        data['K'] = rsv.ewm(com=2, adjust=False).mean()
-        data['D'] = data['K'].ewm(com=2, adjust=False).mean()
-
-        # --- [NEW] 新增特徵計算 (必須與 Trainer 一致) ---
-        data['BB_std'] = data['Close'].rolling(20).std()
-        data['BB_upper'] = data[f'MA20'] + (data['BB_std'] * 2)
-        data['BB_lower'] = data[f'MA20'] - (data['BB_std'] * 2)
-        data['BB_width'] = (data['BB_upper'] - data['BB_lower']) / (data[f'MA20'] + 1e-9)
-        
-        data['Vol_20'] = data['pct_change'].rolling(20).std()
-        
-        data = data.replace([np.inf, -np.inf], np.nan)
-        data = data.ffill().bfill().fillna(0)
-        return data
+    def _flow_digest(self, df):
+        """法人買賣超欄位的 SHA1：refresh_flows 回補後 key 會跟著變，不會沿用舊特徵/舊預測"""
+        cols = [c for c in ('Foreign_BuySell', 'Trust_BuySell') if c in df.columns]
+        if not cols: return ""
+        vals = df[cols].to_numpy(dtype='float64', na_value=0.0)
+        return hashlib.sha1(vals.tobytes()).hexdigest()[:12]
 
-    def _prepare_inference_data(self, df):
-        if self.model is None or self.trained_dataset is None: return None, "模型未就緒"
+    def _base_key(self, df):
+        return (len(df) - 1, pd.Timestamp(df['date'].iloc[-2]), float(df['Close'].iloc[-2]), self._flow_digest(df.iloc[:-1]))
 
-        stock_id = str(df['stock_id'].iloc[0] if 'stock_id' in df.columns else Config.TARGET_STOCK)
-        data = self._preprocess(df, stock_id)
+    def _remember_state(self, stock_id, df, data):
+        """保存「截至昨收」的特徵與增量狀態，供盤中刷新時沿用"""
+        if len(df) <= IncrementalFeatureState.WINDOW: return
+        state = IncrementalFeatureState.from_history(df['Close'].iloc[:-1].to_numpy(), df['Volume'].iloc[:-1].to_numpy())
+        with self._state_lock:
+            self._feature_states[stock_id] = (self._base_key(df), data.iloc[:-1], state)
+            self._feature_states.move_to_end(stock_id)
+            # 全市場掃描時不留下每一檔的整段特徵，只保留最近用過的
+            while len(self._feature_states) > Config.FEATURE_STATE_CACHE_SIZE:
+                self._feature_states.popitem(last=False)
+
+    def _incremental_update(self, stock_id, df):
+        with self._state_lock:
+            entry = self._feature_states.get(stock_id)
+            if entry is not None: self._feature_states.move_to_end(stock_id)
+        if entry is None or len(df) < 2: return None
+        key, base, state = entry
+        if key != self._base_key(df): return None
+
+        last = df.iloc[-1]
+        if pd.isna(last).any(): return None
+        feats = state.peek(last['Close'], last['Volume'])
+
+        row = last.to_dict()
+        row['date'] = pd.Timestamp(row['date'])
+        row['time_idx'] = (row['date'] - pd.Timestamp(Config.START_DATE)).days
+        row['group_id'] = base['group_id'].iloc[-1]
+        row.update({col: feats[col] for col in FEATURE_COLUMNS})
+        tail = pd.DataFrame([row], index=[df.index[-1]])[base.columns]
+        return pd.concat([base, tail])
+
+    def _prepare_inference_data(self, df, data=None):
+        if self.engine is None or self.trained_dataset is None: return None, "模型未就緒"
+
+        if data is None:
+            stock_id = str(df['stock_id'].iloc[0] if 'stock_id' in df.columns else Config.TARGET_STOCK)
+            data = self._preprocess(df, stock_id)
 
         if len(data) < Config.WINDOW_SIZE: return None, f"數據不足 ({len(data)})"
 
@@ -130,41 +235,99 @@ class TechAgent:
         
         return pd.concat([data, pd.DataFrame(future_rows)], ignore_index=True), "OK"
 
-    def analyze(self, df):
-        data, msg = self._prepare_inference_data(df)
-        if data is None: return 0, msg, (0, 0, 0)
+    def _build_dataset(self, data):
+        return TimeSeriesDataSet.from_dataset(self.trained_dataset, data, predict=True, stop_randomization=True, target_normalizer=GroupNormalizer(groups=["group_id"], transformation="softplus"))
+
+    def _predict_raw(self, datasets):
+        """
+        多個單股預測集一次 forward (不經過 Trainer)
+        回傳與 datasets 順序對齊的 prediction tensor (N, PREDICTION_DAYS, 7)
+        """
+        return self.engine.predict(datasets)
+
+    def _forecast_key(self, stock_id, df):
+        last_date = pd.Timestamp(df['date'].iloc[-1]).strftime('%Y-%m-%d')
+        close = float(df['Close'].iloc[-1])
+        return f"{stock_id}|{last_date}|{close:.4f}|{self._flow_digest(df)}|{self.model_fingerprint}"
+
+    def _pred_dates(self, df):
+        # 預測日期只取營業日 (跳過週末)
+        future_dates = []
+        curr_date = df['date'].iloc[-1]
+        for _ in range(Config.PREDICTION_DAYS):
+            curr_date += timedelta(days=1)
+            while curr_date.weekday() >= 5: curr_date += timedelta(days=1)
+            future_dates.append(curr_date)
+        return future_dates
+
+    def _summarize(self, stock_id, df, pred):
+        quantiles = pred.detach().cpu().numpy()
+        curr = df['Close'].iloc[-1]
+        target = quantiles[-1, 3]
+        support = quantiles[-1, 1]
+        roi = (target - curr) / curr
+        score = 1.5 if roi > 0.04 else (1 if roi > 0.015 else (-1 if roi < -0.015 else -1.5))
+        return ForecastResult(
+            stock_id, score, f"目標 {target:.1f} ({roi*100:.2f}%)", curr, target, support,
+            quantiles=quantiles, pred_dates=self._pred_dates(df)
+        )
+
+    def forecast_many(self, dfs):
+        """
+        批次推論：{stock_id: df} -> {stock_id: ForecastResult}
+        所有標的先各自前處理，再合併成一次 batched forward；未變動的序列直接命中快取
+        """
+        self._refresh_model()
+        results = {}
+        pending = {}
+        for stock_id, df in dfs.items():
+            key = self._forecast_key(stock_id, df)
+            cached = self.cache.get(key) if self.engine is not None else None
+            if cached is not None:
+                results[stock_id] = cached
+            else:
+                pending[stock_id] = key
+
+        # 未命中快取的標的一次算完特徵；整批失敗時退回逐檔計算，讓錯誤只影響單一標的
         try:
-            ds = TimeSeriesDataSet.from_dataset(self.trained_dataset, data, predict=True, stop_randomization=True, target_normalizer=GroupNormalizer(groups=["group_id"], transformation="softplus"))
-            dl = ds.to_dataloader(train=False, batch_size=1, num_workers=0)
-            raw = self.model.predict(dl, mode="raw", return_x=False, trainer_kwargs=dict(accelerator="gpu", devices=1))
-            pred = raw['prediction'][0]
-            p50 = pred[:, 3].detach().cpu().numpy()
-            p10 = pred[:, 1].detach().cpu().numpy()
-            curr = df['Close'].iloc[-1]
-            target = p50[-1]
-            support = p10[-1]
-            roi = (target - curr) / curr
-            score = 1.5 if roi > 0.04 else (1 if roi > 0.015 else (-1 if roi < -0.015 else -1.5))
-            return score, f"目標 {target:.1f} ({roi*100:.2f}%)", (curr, target, support)
-        except Exception as e:
-            return 0, f"推論錯誤: {e}", (0, 0, 0)
+            prepared = self._preprocess_many({stock_id: dfs[stock_id] for stock_id in pending}) if self.engine is not None else {}
+        except Exception:
+            prepared = {}
+
+        batch = []
+        for stock_id, key in pending.items():
+            try:
+                data, msg = self._prepare_inference_data(dfs[stock_id], prepared.get(stock_id))
+                if data is None:
+                    results[stock_id] = ForecastResult(stock_id, msg=msg)
+                    continue
+                batch.append((stock_id, key, self._build_dataset(data)))
+            except Exception as e:
+                results[stock_id] = ForecastResult(stock_id, msg=f"推論錯誤: {e}")
+
+        if batch:
+            try:
+                preds = self._predict_raw([ds for _, _, ds in batch])
+                for (stock_id, key, _), pred in zip(batch, preds):
+                    res = self._summarize(stock_id, dfs[stock_id], pred)
+                    self.cache.put(key, res)
+                    results[stock_id] = res
+            except Exception as e:
+                for stock_id, _, _ in batch:
+                    results[stock_id] = ForecastResult(stock_id, msg=f"推論錯誤: {e}")
+
+        return {stock_id: results[stock_id] for stock_id in dfs}
+
+    def forecast(self, df):
+        stock_id = str(df['stock_id'].iloc[0] if 'stock_id' in df.columns else Config.TARGET_STOCK)
+        return self.forecast_many({stock_id: df})[stock_id]
+
+    def analyze_many(self, dfs):
+        """{stock_id: df} -> {stock_id: (score, msg, (curr, target, support))}"""
+        return {stock_id: res.as_tuple() for stock_id, res in self.forecast_many(dfs).items()}
+
+    def analyze(self, df):
+        return self.forecast(df).as_tuple()
 
     def get_plot_data(self, df):
-        data, _ = self._prepare_inference_data(df)
-        if data is None: return {}
-        try:
-            ds = TimeSeriesDataSet.from_dataset(self.trained_dataset, data, predict=True, stop_randomization=True, target_normalizer=GroupNormalizer(groups=["group_id"], transformation="softplus"))
-            dl = ds.to_dataloader(train=False, batch_size=1, num_workers=0)
-            raw = self.model.predict(dl, mode="raw", return_x=False, trainer_kwargs=dict(accelerator="gpu", devices=1))
-            pred = raw['prediction'][0]
-            future_dates = []
-            curr_date = df['date'].iloc[-1]
-            for _ in range(Config.PREDICTION_DAYS):
-                curr_date += timedelta(days=1)
-                while curr_date.weekday() >= 5: curr_date += timedelta(days=1)
-                future_dates.append(curr_date)
-            return {
-                "hist_dates": df['date'], "hist_close": df['Close'], "pred_dates": future_dates,
-                "p10": pred[:, 1].detach().cpu().numpy(), "p50": pred[:, 3].detach().cpu().numpy(), "p90": pred[:, 5].detach().cpu().numpy()
-            }
-        except: return {}
\ No newline at end of file
+        return self.forecast(df).to_plot_data(df)
@@ -9,8 +9,6 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 # -------------------
 
-import pandas as pd
-import numpy as np
 import torch
 import lightning.pytorch as pl
 from lightning.pytorch.callbacks import EarlyStopping, ModelCheckpoint, LearningRateMonitor
@@ -19,6 +17,7 @@ from pytorch_forecasting.data import GroupNormalizer
 from pytorch_forecasting.metrics import QuantileLoss
 from config.settings import Config
 from utils.data_loader import DataLoader
+from utils.panel_cache import PanelCache
 import colorama
 from colorama import Fore
 
@@ -42,69 +41,28 @@ class UniversalModelTrainer:
 
     def prepare_universal_data(self):
         print(f"{Fore.YELLOW}[Trainer] 正在構建穩健型數據池 (含 BB/Vol)...")
-        all_df = []
-        for stock_id in self.universe:
-            try:
-                df = self.loader.fetch_data(stock_id, force_update=False)
-                if len(df) < Config.WINDOW_SIZE + Config.PREDICTION_DAYS:
-                    continue
-                df = self._add_features(df, stock_id)
-                all_df.append(df)
-                print(f" -> 已載入 {stock_id} ({len(df)} rows)")
-            except Exception as e:
-                print(f" -> {stock_id} 載入失敗: {e}")
-
-        if not all_df:
+        raw = {}
+        # 整個 universe 一次查詢讀出，缺資料的才個別下載；盤中價不是定案收盤，不進訓練面板
+        frames = self.loader.fetch_many(self.universe, force_update=False, realtime=False)
+        # 日K就緒後批次匯入法人買賣超 (只補 ingest_log 之後的區間)，有新資料才重讀一次 DB
+        if self.loader.refresh_flows(self.universe):
+            frames = self.loader.fetch_many(self.universe, force_update=False, realtime=False)
+        for stock_id, df in frames.items():
+            if df is None:
+                print(f" -> {stock_id} 載入失敗")
+                continue
+            if len(df) < Config.WINDOW_SIZE + Config.PREDICTION_DAYS:
+                continue
+            raw[stock_id] = df
+            print(f" -> 已載入 {stock_id} ({len(df)} rows)")
+
+        if not raw:
             raise ValueError("沒有任何數據可供訓練！")
 
-        full_data = pd.concat(all_df, ignore_index=True)
-        full_data['group_id'] = full_data['group_id'].astype(str)
-        return full_data
-
-    def _add_features(self, df, stock_id):
-        data = df.copy()
-        data['date'] = pd.to_datetime(data['date'])
-        min_date = pd.Timestamp(Config.START_DATE)
-        data['time_idx'] = (data['date'] - min_date).dt.days
-        
-        data['group_id'] = str(stock_id)
-        data['log_volume'] = np.log1p(data['Volume'])
-        data['pct_change'] = data['Close'].pct_change()
-        
-        for w in [5, 20, 60]:
-            data[f'MA{w}'] = data['Close'].rolling(w).mean()
-            data[f'Bias{w}'] = (data['Close'] - data[f'MA{w}']) / (data[f'MA{w}'] + 1e-9)
-        
-        delta = data['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(6).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(6).mean()
-        rs = gain / (loss + 1e-9)
-        data['RSI6'] = 100 - (100 / (1 + rs))
-        
-        # MACD
-        exp12 = data['Close'].ewm(span=12, adjust=False).mean()
-        exp26 = data['Close'].ewm(span=26, adjust=False).mean()
-        data['MACD'] = exp12 - exp26
-        data['MACD_signal'] = data['MACD'].ewm(span=9, adjust=False).mean()
-        data['MACD_hist'] = data['MACD'] - data['MACD_signal']
-        
-        # KD
-        low_min = data['Close'].rolling(9).min()
-        high_max = data['Close'].rolling(9).max()
-        rsv = (data['Close'] - low_min) / (high_max - low_min + 1e-9) * 100
-        data['K'] = rsv.ewm(com=2, adjust=False).mean()
-        data['D'] = data['K'].ewm(com=2, adjust=False).mean()
-
-        # BB & Vol (保留這些好用的新特徵)
-        data['BB_std'] = data['Close'].rolling(20).std()
-        data['BB_upper'] = data['MA20'] + (data['BB_std'] * 2)
-        data['BB_lower'] = data['MA20'] - (data['BB_std'] * 2)
-        data['BB_width'] = (data['BB_upper'] - data['BB_lower']) / (data['MA20'] + 1e-9)
-        data['Vol_20'] = data['pct_change'].rolling(20).std()
-
-        data = data.replace([np.inf, -np.inf], np.nan)
-        data = data.ffill().bfill().fillna(0)
-        return data
+        # 特徵面板以 memmap 落地 (特徵只有這一個來源)：追加新交易日並重寫尾段，宇宙變動時才重建
+        panel = PanelCache()
+        panel.sync(raw)
+        return panel.to_frame()
 
     def train(self):
         data = self.prepare_universal_data()
@@ -69,6 +69,18 @@ except Exception as e:
     st.error(f"🔥 系統核心啟動失敗: {e}")
     st.stop()
 
+def render_scan(stream):
+    """邊掃描邊更新畫面：每出爐一檔就刷新表格，保留全部結果並依絕對預期波動排序"""
+    caption = st.empty()
+    board = st.empty()
+    found = []
+    for res, _ in stream:
+        found.append(res)
+        found.sort(key=lambda r: abs(r['ai_roi_pct']), reverse=True)
+        caption.caption(f"已發現 {len(found)} 檔獵物")
+        board.dataframe(pd.DataFrame(found), use_container_width=True)
+    if not found: board.info("掃描完成，無符合 AI 高波動標準之標的。")
+
 # --- 4. 側邊欄導航 ---
 with st.sidebar:
     st.title("🛡️ 鋼鐵紀律")
@@ -367,11 +379,9 @@ elif page == "🛠️ 手動分析工具":
         if st.button("啟動獵鷹掃描"):
             with st.status("獵鷹運作中...", expanded=True):
                 dynamic_list = hunt.hunt(mode="aggressive")
-                orig = scan.target_stocks
-                scan.target_stocks = dynamic_list
-                res = scan.scan(strategy="AI_Alpha")
-                scan.target_stocks = orig
-                st.dataframe(res)
+                table = hunt.last_table
+                heat = table['heat'].to_dict() if table is not None and not table.empty else None
+                render_scan(scan.scan_iter(dynamic_list, priority=heat))
     
     with tool_tab2:
         if st.button("啟動清單掃描"):
@@ -380,11 +390,7 @@ elif page == "🛠️ 手動分析工具":
             else:
                 ids = [x['id'] for x in mylist]
                 with st.status(f"掃描 {len(ids)} 檔...", expanded=True):
-                    orig = scan.target_stocks
-                    scan.target_stocks = ids
-                    res = scan.scan("AI_Alpha")
-                    scan.target_stocks = orig
-                    st.dataframe(res)
+                    render_scan(scan.scan_iter(ids))
 
     with tool_tab3:
         c1, c2 = st.columns([1, 3])
@@ -395,8 +401,9 @@ elif page == "🛠️ 手動分析工具":
             with st.spinner("分析中..."):
                 df = DataLoader().fetch_data(target_stock, force_update=True)
                 if df is not None and len(df) > 60:
-                    sc, msg, (c, t, s) = tech.analyze(df)
-                    plot = tech.get_plot_data(df)
+                    fc = tech.forecast(df)
+                    sc, msg, (c, t, s) = fc.as_tuple()
+                    plot = fc.to_plot_data(df)
                     wplan = warrant.generate_plan(c, t, s, sc)
                     if 'macro_data' not in st.session_state: st.session_state.macro_data = macro.analyze()
                     adv = strat.consult(target_stock, (c, t, s), wplan, st.session_state.macro_data, portfolio.get_summary())
@@ -39,10 +39,68 @@ class Config:
     # TFT 模型參數
     WINDOW_SIZE = 120
     PREDICTION_DAYS = 10
+    INFERENCE_BATCH_SIZE = 128  # 批次推論時每個 forward 的最大股票數
+    FORECAST_CACHE_SIZE = 512   # 推論結果 LRU 快取筆數
+    FORECAST_CACHE_DISK = True  # 是否啟用 SQLite 磁碟快取層
+    FORECAST_CACHE_TTL_DAYS = 7
+    FEATURE_STATE_CACHE_SIZE = 256  # 盤中增量特徵狀態最多保留幾檔 (LRU)
+    PANEL_REWRITE_DAYS = 20     # 特徵面板每次 sync 重寫最後幾個交易日 (吸收 DB 的修正與回補)
+
+    # 歷史日K 儲存後端: "sqlite" (預設) 或 "parquet" (需 pyarrow，SQLite 仍會同步寫入)
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+
+    # SQLite 連線調校
+    DB_MMAP_SIZE = 256 * 1024 * 1024  # mmap 讀取上限 (bytes)
+    DB_CACHE_KB = 64 * 1024           # 每條連線的 page cache (KB)
+
+    # 掃描併發參數
+    SCAN_WORKERS = 8            # 抓資料的執行緒數 (1 = 舊的逐檔模式)
+    SCAN_CHUNK_SIZE = 16        # 串流掃描的 micro-batch 上限 (已抓好的標的合併成一次 batched TFT)
+    TACTICS_SCAN_BUDGET = 600   # 盤前戰術會議的掃描時間預算 (秒)
+    RATE_LIMITS = {             # 各資料源每秒請求上限 (rate, burst)
+        "yfinance": (2.0, 2),
+        "yahoo": (5.0, 5),
+        "mis": (2.0, 2),        # 證交所 MIS 批次報價
+    }
+    # FinMind 共用 gateway：依方案每小時請求數限流，402/429 時指數退避
+    FINMIND_REQUESTS_PER_HOUR = int(os.getenv("FINMIND_REQUESTS_PER_HOUR", "600"))
+    FINMIND_BURST = 30
+    FINMIND_MAX_RETRIES = 3
+    FINMIND_BACKOFF_BASE = 2.0  # 秒，第 n 次重試等待 base * 2^n
+    # 全市場單日行情 (收盤後整批補檔)
+    MARKET_REFRESH_DAYS = 10    # 往回檢查幾個營業日
+    MARKET_COMPLETE_RATIO = 0.9 # 某日入庫檔數不到區間內最多那天的此比例，視為尚未整批入庫
+    MARKET_REFRESH_TTL = 1800   # 同一日期查無資料 (假日、尚未收盤) 後多久再試 (秒)
+    MARKET_PUBLISH_HOUR = 15    # 當日日K大約幾點後可從 FinMind 取得 (之前只補到前一個營業日)
+    # 法人買賣超 (FinMind TaiwanStockInstitutionalInvestorsBuySell) 的 name -> 欄位
+    FLOW_INVESTORS = {
+        "Foreign_BuySell": ["Foreign_Investor", "Foreign_Dealer_Self"],
+        "Trust_BuySell": ["Investment_Trust"],
+    }
+    MARGIN_LOOKBACK_DAYS = 10   # 籌碼評分使用的融資融券天數 (日曆日)
+    SYMBOL_INDEX_REFRESH_DAYS = 7  # 代號對照表 (FinMind 股票總表) 多久重新匯入一次
+    HUNTER_CACHE_TTL = 180      # 排行榜解析結果共用秒數
+    HUNTER_TOP_N = 30           # 每個榜單取前幾名
+    # 獵人候選來源 (可插拔)：fetch 對應 HunterAgent._source_<fetch>，weight 為熱度權重
+    HUNTER_SOURCES = {
+        "volume": {"rank_type": "volume", "weight": 1.0},
+        "change_up": {"rank_type": "change-up", "weight": 1.2},
+        "turnover": {"rank_type": "turnover-ratio", "weight": 0.8},
+        "foreign_net_buy": {"fetch": "foreign_net_buy", "weight": 1.0},
+        "limit_up": {"fetch": "limit_up", "weight": 1.5},
+    }
+    HUNTER_MODES = {
+        "aggressive": ["volume", "change_up", "turnover", "foreign_net_buy", "limit_up"],
+        "conservative": ["volume"],
+        "institutional": ["volume", "foreign_net_buy"],
+    }
+    QUOTE_CACHE_TTL = 10        # 即時報價共用秒數 (多個 Agent 在此期間詢問同一檔只發一次請求)
     
     # 風控參數
     MAX_LOSS_PERCENT = 0.02 
-    ATR_MULTIPLIER = 2.0     
+    ATR_MULTIPLIER = 2.0     # 停損距離 = ATR_MULTIPLIER x ATR
+    ATR_PERIOD = 14          # Wilder ATR 週期
+    ATR_PCT_LIMIT = 0.035    # ATR 佔股價超過此比例視為波動過大 (風控鎖單)
     
     # 路徑設定 (使用絕對路徑比較安全)
     DATA_DIR = os.path.join(project_root, "data")
@@ -5,6 +5,7 @@ from config.settings import Config
 from utils.data_loader import DataLoader
 from agents.tech_agent import TechAgent
 from agents.screener import MarketScanner
+from utils.finmind_gateway import get_finmind
 import colorama
 from colorama import Fore, Style
 
@@ -22,24 +23,26 @@ def main():
     # 2. 初始化掃描器 (注入大腦)
     scanner = MarketScanner(tech_agent=tech_agent)
 
-    # 3. 執行掃描
+    # 3. 執行掃描 (串流：每出爐一檔就即時印出)
     print(f"\n{Fore.WHITE}>>> 開始執行 AI Alpha 策略掃描...")
-    df_results = scanner.scan(strategy="AI_Alpha")
+    results = []
+    top = []
+    for res, top in scanner.scan_iter(top_k=10):
+        results.append(res)
+        print(f"{Fore.CYAN}   [即時] {res['stock_id']:<6} 預期 {res['ai_roi_pct']:>6.2f}% | 目前第一名 {top[0]['stock_id']}")
 
     # 4. 顯示結果
     print(f"\n{Fore.WHITE}{'='*60}")
     print(f"{Fore.GREEN}🏆 AI 嚴選潛力股清單 (按預期漲幅排序)")
     print(f"{Fore.WHITE}{'='*60}")
 
-    if not df_results.empty:
-        # 顯示前 10 名
-        top_picks = df_results.head(10)
-        
+    if results:
+        # 顯示前 10 名 (掃描過程維護的 Top-K)
         # 美化輸出表格
         print(f"{'代號':<8} {'現價':<10} {'AI目標價':<10} {'預期漲幅':<10} {'強力支撐':<10} {'AI訊號'}")
         print("-" * 60)
         
-        for _, row in top_picks.iterrows():
+        for row in top:
             stock = row['stock_id']
             price = row['price']
             target = row['ai_target']
@@ -53,10 +56,12 @@ def main():
             
             print(f"{stock:<8} {price:<10.1f} {target:<10.1f} {roi_color}{roi:>6.2f}%{Fore.RESET}   {support:<10.1f} {score_str}")
             
-        print(f"\n{Fore.WHITE}共發現 {len(df_results)} 檔標的，請結合籌碼面與消息面進行最終確認。")
+        print(f"\n{Fore.WHITE}共發現 {len(results)} 檔標的，請結合籌碼面與消息面進行最終確認。")
     else:
         print(f"{Fore.YELLOW}今日市場風險較高，AI 未發現高信心度的做多標的。建議空手觀望。")
 
+    # 本次執行的 FinMind 用量 (距離方案上限還有多少)
+    get_finmind().report(refresh=True)
     print(f"{Fore.WHITE}{'='*60}\n")
 
 if __name__ == "__main__":
@@ -0,0 +1,15 @@
+# tests/conftest.py
+import os
+import sys
+
+# --- 🚑 路徑急救包 (讓 tests/ 可以直接 import utils / agents) ---
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+# -------------------
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return f.read()
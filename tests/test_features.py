@@ -0,0 +1,47 @@
+# tests/test_features.py (向量化特徵引擎 vs 舊版 pandas _add_features 的一致性)
+import numpy as np
+import pandas as pd
+import pytest
+from utils.features import compute_feature_block, _stack, FEATURE_COLUMNS
+
+def _pandas_features(df):
+    """舊版 UniversalModelTrainer._add_features 的特徵計算 (不含最後的補值)"""
+    c, f = df['Close'], {}
+    f['log_volume'] = np.log1p(df['Volume'])
+    f['pct_change'] = c.pct_change()
+    for w in [5, 20, 60]:
+        f[f'MA{w}'] = c.rolling(w).mean()
+        f[f'Bias{w}'] = (c - f[f'MA{w}']) / (f[f'MA{w}'] + 1e-9)
+    delta = c.diff()
+    gain = delta.where(delta > 0, 0).rolling(6).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(6).mean()
+    f['RSI6'] = 100 - (100 / (1 + gain / (loss + 1e-9)))
+    f['MACD'] = c.ewm(span=12, adjust=False).mean() - c.ewm(span=26, adjust=False).mean()
+    f['MACD_signal'] = f['MACD'].ewm(span=9, adjust=False).mean()
+    f['MACD_hist'] = f['MACD'] - f['MACD_signal']
+    low_min, high_max = c.rolling(9).min(), c.rolling(9).max()
+    f['K'] = ((c - low_min) / (high_max - low_min + 1e-9) * 100).ewm(com=2, adjust=False).mean()
+    f['D'] = f['K'].ewm(com=2, adjust=False).mean()
+    f['BB_std'] = c.rolling(20).std()
+    f['BB_upper'] = f['MA20'] + f['BB_std'] * 2
+    f['BB_lower'] = f['MA20'] - f['BB_std'] * 2
+    f['BB_width'] = (f['BB_upper'] - f['BB_lower']) / (f['MA20'] + 1e-9)
+    f['Vol_20'] = f['pct_change'].rolling(20).std()
+    return pd.DataFrame(f).replace([np.inf, -np.inf], np.nan)
+
+def _frame(n, gaps, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 + rng.standard_normal(n).cumsum()
+    close[gaps] = np.nan
+    return pd.DataFrame({'Close': close, 'Volume': rng.integers(1000, 9000, n).astype(float)})
+
+@pytest.mark.parametrize("gaps", [[], [40, 41, 90], [0, 1, 60]])
+def test_block_matches_pandas_with_gaps(gaps):
+    # 長度不同的股票一起算：較短的那檔左側有補齊區，中間的缺值不能被當成補齊區
+    frames = [_frame(150, gaps, 1), _frame(200, [], 2)]
+    block = compute_feature_block(_stack(frames, 'Close'), _stack(frames, 'Volume'), [len(df) for df in frames])
+    t = block['MA5'].shape[1]
+    for i, df in enumerate(frames):
+        ref = _pandas_features(df)
+        for col in FEATURE_COLUMNS:
+            np.testing.assert_allclose(block[col][i, t - len(df):], ref[col].to_numpy(), rtol=1e-7, atol=1e-7, err_msg=col)
@@ -0,0 +1,71 @@
+# tests/test_html_extract.py (正規式擷取 vs 舊版 BeautifulSoup 解析的一致性)
+import re
+import pytest
+from conftest import load_fixture
+from utils.html_extract import og_description, quote_price, quote_links
+
+bs4 = pytest.importorskip("bs4")
+
+RANK_PAGES = ["yahoo_rank_volume.html", "yahoo_rank_mixed.html"]
+QUOTE_PAGES = ["yahoo_quote_2330.html", "yahoo_quote_6488.html", "yahoo_quote_missing.html", "yahoo_quote_no_meta.html"]
+
+def _soup_links(html):
+    """舊版 HunterAgent._fetch_rank 的解析方式 (只取代號)"""
+    soup = bs4.BeautifulSoup(html, "html.parser")
+    out = []
+    for link in soup.find_all("a", href=re.compile(r"/quote/\d+\.(TW|TWO)")):
+        match = re.search(r"(\d+)\.(TW|TWO)", link.get("href"))
+        if match: out.append(match.group(1))
+    return out
+
+def _soup_price(html):
+    """舊版 _get_realtime_price 的解析方式"""
+    soup = bs4.BeautifulSoup(html, "html.parser")
+    meta = soup.find("meta", property="og:description")
+    if not meta: return None
+    content = meta.get("content", "")
+    if "查無" in content: return None
+    match = re.search(r"成交價\s*([\d,]+\.?\d*)", content)
+    if not match: return None
+    price = float(match.group(1).replace(",", ""))
+    return price if price > 0 else None
+
+@pytest.mark.parametrize("name", RANK_PAGES)
+def test_quote_links_match_soup(name):
+    html = load_fixture(name)
+    # 舊版會把 1234.TWOX 也當成 1234，新版刻意排除
+    expected = [s for s in _soup_links(html) if s != "1234"]
+    assert [stock_id for stock_id, _ in quote_links(html)] == expected
+
+def test_quote_links_keep_otc_exchange():
+    links = quote_links(load_fixture("yahoo_rank_volume.html"))
+    assert links[:3] == [("6488", "TWO"), ("3105", "TWO"), ("8299", "TWO")]
+    assert {exchange for _, exchange in links} == {"TWO"}
+    assert ("1234", "TW") not in links and ("1234", "TWO") not in links
+
+def test_quote_links_mixed_exchanges():
+    links = dict(quote_links(load_fixture("yahoo_rank_mixed.html")))
+    assert links["2330"] == "TW"
+    assert links["6488"] == "TWO"
+    assert links["3105"] == "TWO"
+    assert links["2454"] == "TW"
+    assert "1101" not in links  # 不是 <a href>
+
+def test_quote_links_inline():
+    assert quote_links('<a href="/quote/6488.TWO">') == [("6488", "TWO")]
+    assert quote_links('<a href="/quote/2330.TW">') == [("2330", "TW")]
+
+@pytest.mark.parametrize("name", QUOTE_PAGES)
+def test_quote_price_matches_soup(name):
+    html = load_fixture(name)
+    assert quote_price(html) == _soup_price(html)
+
+def test_quote_price_values():
+    assert quote_price(load_fixture("yahoo_quote_2330.html")) == 1085.0
+    assert quote_price(load_fixture("yahoo_quote_6488.html")) == 412.5
+    assert quote_price(load_fixture("yahoo_quote_missing.html")) is None
+    assert quote_price(load_fixture("yahoo_quote_no_meta.html")) is None
+
+def test_og_description_unescapes_entities():
+    content = og_description(load_fixture("yahoo_quote_6488.html"))
+    assert content.endswith("& 更多資訊。")
@@ -0,0 +1,155 @@
+# tests/test_realtime_quote.py (RealtimeQuoteService：MIS 批次、備援順序、TTL 與漲停判斷)
+import types
+import pandas as pd
+import pytest
+from conftest import load_fixture
+from config.settings import Config
+from utils.rate_limiter import RateLimiter
+
+rq = pytest.importorskip("utils.realtime_quote")
+
+class FakeResponse:
+    def __init__(self, status_code=200, payload=None, text=""):
+        self.status_code = status_code
+        self._payload = payload
+        self.text = text
+
+    def json(self):
+        if self._payload is None: raise ValueError("not json")
+        return self._payload
+
+class FakeSession:
+    """
+    取代 requests.Session：依網址分派給測試提供的回應，並記下每次請求
+    mis: {channel (例如 tse_2330.tw): MIS row}；yahoo: {(stock_id, exchange): fixture 檔名}
+    """
+    def __init__(self, mis=None, yahoo=None):
+        self.mis = mis or {}
+        self.yahoo = yahoo or {}
+        self.calls = []
+
+    def get(self, url, timeout=None, params=None):
+        if url == rq.RealtimeQuoteService.MIS_URL:
+            channels = params["ex_ch"].split("|")
+            self.calls.append(("mis", channels))
+            return FakeResponse(payload={"msgArray": [self.mis[c] for c in channels if c in self.mis]})
+        if "mis.twse.com.tw" in url:
+            return FakeResponse()
+        if "tw.stock.yahoo.com" in url:
+            stock_id, exchange = url.rsplit("/", 1)[1].split(".")
+            self.calls.append(("yahoo", f"{stock_id}.{exchange}"))
+            name = self.yahoo.get((stock_id, exchange))
+            return FakeResponse(text=load_fixture(name)) if name else FakeResponse(status_code=404)
+        raise AssertionError(f"unexpected url {url}")
+
+class FakeTicker:
+    prices = {}
+    calls = []
+
+    def __init__(self, symbol):
+        FakeTicker.calls.append(symbol)
+        self.fast_info = types.SimpleNamespace(last_price=self.prices.get(symbol))
+
+    def history(self, **kwargs):
+        return pd.DataFrame()
+
+class Clock:
+    def __init__(self): self.now = 1000.0
+    def monotonic(self): return self.now
+
+def _row(stock_id, ex, z, u=None):
+    return {"c": stock_id, "ex": ex, "z": z, "b": "-", "u": u}
+
+@pytest.fixture
+def make_service(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "DATA_DIR", str(tmp_path))
+    from utils.db_manager import DBManager
+    from utils.symbol_index import SymbolIndex
+    symbols = SymbolIndex(DBManager())
+    monkeypatch.setattr(rq, "get_symbol_index", lambda: symbols)
+    clock = Clock()
+    monkeypatch.setattr(rq, "time", clock)
+    FakeTicker.prices, FakeTicker.calls = {}, []
+    monkeypatch.setattr(rq.yf, "Ticker", FakeTicker)
+
+    def make(session, ttl=10):
+        svc = rq.RealtimeQuoteService(ttl=ttl)
+        svc.session = session
+        svc.limiters = {name: RateLimiter(1e6, 1000) for name in ("mis", "yahoo", "yfinance")}
+        svc.clock = clock
+        return svc
+    return make
+
+def test_mis_splits_batches(make_service):
+    ids = [str(1000 + i) for i in range(120)]
+    session = FakeSession(mis={f"tse_{s}.tw": _row(s, "tse", "10.5") for s in ids})
+    svc = make_service(session)
+    for s in ids: svc.symbols.remember(s, "TW")
+
+    prices = svc.get_many(ids)
+    batches = [channels for kind, channels in session.calls if kind == "mis"]
+    assert [len(b) for b in batches] == [50, 50, 20]
+    assert sum(batches, []) == [f"tse_{s}.tw" for s in ids]
+    assert set(prices.values()) == {10.5}
+
+def test_mis_unknown_exchange_asks_both_and_remembers(make_service):
+    session = FakeSession(mis={"otc_6488.tw": _row("6488", "otc", "412.5")})
+    svc = make_service(session)
+
+    assert svc.get_many(["6488"]) == {"6488": 412.5}
+    assert session.calls == [("mis", ["otc_6488.tw", "tse_6488.tw"])]
+    assert svc.symbols.exchange("6488") == "TWO"
+
+def test_fallback_order_mis_yahoo_yfinance(make_service):
+    # 2330: MIS 沒給價 -> Yahoo 上櫃查無 -> Yahoo 上市命中
+    session = FakeSession(yahoo={("2330", "TW"): "yahoo_quote_2330.html", ("9999", "TWO"): "yahoo_quote_missing.html"})
+    svc = make_service(session)
+    assert svc.get("2330") == 1085.0
+    assert session.calls == [("mis", ["otc_2330.tw", "tse_2330.tw"]), ("yahoo", "2330.TWO"), ("yahoo", "2330.TW")]
+    assert svc.symbols.exchange("2330") == "TW"
+    assert FakeTicker.calls == []
+
+    # 9999: MIS、Yahoo 都沒有 -> yfinance (上市先)
+    FakeTicker.prices = {"9999.TWO": 55.0}
+    assert svc.get("9999") == 55.0
+    assert session.calls[-2:] == [("yahoo", "9999.TWO"), ("yahoo", "9999.TW")]
+    assert FakeTicker.calls == ["9999.TW", "9999.TWO"]
+    assert svc.symbols.exchange("9999") == "TWO"
+
+def test_ttl_shares_and_expires(make_service):
+    session = FakeSession(mis={"tse_2330.tw": _row("2330", "tse", "1085")})
+    svc = make_service(session, ttl=10)
+    svc.symbols.remember("2330", "TW")
+
+    assert svc.get("2330") == 1085.0
+    svc.clock.now += 9
+    assert svc.get("2330") == 1085.0
+    assert len(session.calls) == 1
+
+    session.mis["tse_2330.tw"] = _row("2330", "tse", "1090")
+    svc.clock.now += 2
+    assert svc.get("2330") == 1090.0
+    assert len(session.calls) == 2
+
+def test_failed_quote_is_cached_until_ttl(make_service):
+    session = FakeSession()
+    svc = make_service(session, ttl=10)
+    svc.symbols.remember("1234", "TW")
+
+    assert svc.get("1234") is None
+    assert svc.get("1234") is None
+    assert len(FakeTicker.calls) == 1
+    svc.clock.now += 11
+    assert svc.get("1234") is None
+    assert len(FakeTicker.calls) == 2
+
+def test_limit_up(make_service):
+    session = FakeSession(mis={
+        "tse_2330.tw": _row("2330", "tse", "1190", u="1190"),
+        "tse_2317.tw": _row("2317", "tse", "180", u="198"),
+        "otc_6488.tw": _row("6488", "otc", "453.5", u="453.5"),
+    })
+    svc = make_service(session)
+    for s, ex in [("2330", "TW"), ("2317", "TW"), ("6488", "TWO")]: svc.symbols.remember(s, ex)
+
+    assert svc.limit_up(["6488", "2317", "2330"]) == ["6488", "2330"]
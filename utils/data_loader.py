@@ -1,15 +1,18 @@
 # utils/data_loader.py (V9 - Silent & Robust Edition)
 import pandas as pd
-import requests
 import yfinance as yf
 from datetime import date, datetime, timedelta
-from FinMind.data import DataLoader as FinMindDataLoader
 from config.settings import Config
 from utils.db_manager import DBManager
+from utils.rate_limiter import get_limiter
+from utils.finmind_gateway import get_finmind, FinMindQuotaExceeded
+from utils.realtime_quote import get_quote_service
+from utils.symbol_index import get_symbol_index
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import colorama
 from colorama import Fore
-import re
-from bs4 import BeautifulSoup
 
 # --- 靜音 yfinance 的內部錯誤 ---
 import logging
@@ -19,107 +22,383 @@ logging.getLogger('yfinance').setLevel(logging.CRITICAL)
 colorama.init(autoreset=True)
 
 class DataLoader:
+    # 與 daily_metrics 對應的標準欄位
+    COLUMNS = ['date', 'stock_id', 'Close', 'Volume', 'Foreign_BuySell', 'Trust_BuySell', 'Open', 'High', 'Low', 'Adj_Factor']
+
     def __init__(self):
-        self.api = FinMindDataLoader()
-        
-        user = Config.FINMIND_USER
-        pwd = Config.FINMIND_PASS
-        
-        if user: user = str(user).strip()
-        if pwd: pwd = str(pwd).strip()
-        
-        if user and pwd:
-            try:
-                self.api.login(user_id=user, password=pwd)
-            except Exception as e:
-                print(f"{Fore.RED}[DataLoader] FinMind 登入失敗: {e}")
+        # 與 ChipAgent / FundamentalAgent 共用同一個 FinMind 登入、限流與用量統計
+        self.api = get_finmind()
         
         self.db = DBManager()
+        # 各資料源獨立限流 (全程序共用同一個 bucket)，讓掃描可以多執行緒同時抓資料
+        self.limiters = {name: get_limiter(name) for name in Config.RATE_LIMITS}
+        # yf.download 內部用全域 dict 暫存結果，多執行緒同時呼叫會互相覆蓋，必須序列化
+        self._yf_lock = threading.Lock()
+        self.quotes = get_quote_service()
+        # 代號 -> 交易所對照：過期時用 FinMind 股票總表整批更新 (每個程序最多一次)
+        self.symbols = get_symbol_index()
+        self.symbols.ensure_fresh(self.api)
     
     def _get_realtime_price(self, stock_id):
-        # ... (保持 V8 的 BeautifulSoup 爬蟲邏輯不變) ...
-        try:
-            exchanges = ['TWO', 'TW']
-            for exchange in exchanges:
-                url = f"https://tw.stock.yahoo.com/quote/{stock_id}.{exchange}"
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-                }
-                res = requests.get(url, headers=headers, timeout=3)
-                if res.status_code != 200: continue
-                
-                soup = BeautifulSoup(res.text, 'html.parser')
-                meta = soup.find("meta", property="og:description")
-                
-                if meta:
-                    content = meta.get("content", "")
-                    if "查無" in content: continue
-                    match = re.search(r'成交價\s*([\d,]+\.?\d*)', content)
-                    if match:
-                        price = float(match.group(1).replace(',', ''))
-                        if price > 0: return price
-        except: pass
-
-        # yfinance 備援 (靜音版)
-        try:
-            for suffix in ['.TW', '.TWO']:
-                ticker = yf.Ticker(f"{stock_id}{suffix}")
-                try:
-                    if hasattr(ticker, 'fast_info'):
-                        price = ticker.fast_info.last_price
-                        if price and price > 0: return price
-                except: pass
-                
-                try:
-                    df_rt = ticker.history(period="1d", interval="1m")
-                    if not df_rt.empty:
-                        price = df_rt['Close'].iloc[-1]
-                        if price > 0: return price
-                except: pass
-        except: pass
+        """盤中即時價 (共用報價服務：批次 MIS、記住交易所、短 TTL 快取)"""
+        return self.quotes.get(stock_id)
 
-        return None
+    def _in_quote_hours(self):
+        now = datetime.now()
+        return 0 <= now.weekday() <= 4 and 8 <= now.hour <= 16
 
-    def _fetch_from_yfinance(self, stock_id):
+    def _fetch_from_yfinance(self, stock_id, start_date=None):
         # ... (保持 V8 邏輯，但確保不會報錯) ...
         print(f"{Fore.YELLOW}[Data] 啟動備援 (yfinance) {stock_id}...")
         try:
-            for suffix in ['.TW', '.TWO']:
+            # 對照表知道交易所就只下載那一個
+            for exchange in self.symbols.exchange_order(stock_id, default=('TW', 'TWO')):
                 # 這裡的 progress=False 會隱藏進度條，我們再加 logger 設定隱藏錯誤
-                df = yf.download(f"{stock_id}{suffix}", start=Config.START_DATE, progress=False)
+                self.limiters["yfinance"].acquire()
+                with self._yf_lock:
+                    df = yf.download(f"{stock_id}.{exchange}", start=start_date or Config.START_DATE, progress=False)
                 if not df.empty:
                     if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
                     df = df.reset_index()
                     df = df.rename(columns={"Date": "date", "Close": "Close", "Volume": "Volume"})
                     if 'Close' not in df.columns: continue
-                    df = df[df['Close'] > 0]
+                    df = df[df['Close'] > 0].copy()
                     df['stock_id'] = stock_id
                     df['Foreign_BuySell'] = 0
                     df['Trust_BuySell'] = 0
+                    # yfinance 的價格已自行還原，沒有逐日調整比
+                    df['Adj_Factor'] = float('nan')
                     df['date'] = pd.to_datetime(df['date']).dt.tz_localize(None)
-                    return df[['date', 'stock_id', 'Close', 'Volume', 'Foreign_BuySell', 'Trust_BuySell']]
+                    self.symbols.remember(stock_id, exchange)
+                    return df[self.COLUMNS]
             return None
         except: return None
 
-    def fetch_data(self, stock_id, force_update=False):
+    def _normalize_finmind(self, df_p):
+        """FinMind TaiwanStockPrice -> 與 DB 相同的欄位 (stock_id 取自回傳資料，單檔或全市場皆可)"""
+        df_p['date'] = pd.to_datetime(df_p['date'])
+        df_p = df_p.rename(columns={"open": "Open", "max": "High", "min": "Low", "close": "Close", "Trading_Volume": "Volume"})
+        df_p = df_p[df_p['Close'] > 0].copy()
+        df_p['stock_id'] = df_p['stock_id'].astype(str)
+        df_p = df_p.sort_values(['stock_id', 'date'], ignore_index=True)
+        df_p['Foreign_BuySell'] = 0
+        df_p['Trust_BuySell'] = 0
+        df_p['Adj_Factor'] = self._adj_factors(df_p)
+        return df_p[self.COLUMNS]
+
+    def _adj_factors(self, df_p):
+        """
+        每日調整比 = 當日參考價 (收盤 - 漲跌價差) / 前日收盤；除權息、減資日才不是 1
+        每檔第一天的前日收盤從 DB 取 (增量、全市場單日補檔)，DB 也沒有就視為 1
+        """
+        if 'spread' not in df_p.columns: return float('nan')
+        prev = df_p.groupby('stock_id', sort=False)['Close'].shift(1)
+        first = prev.isna()
+        if first.any():
+            known = self.db.prev_closes(df_p.loc[first, 'stock_id'].unique(), df_p.loc[first, 'date'].min().strftime('%Y-%m-%d'))
+            prev[first] = df_p.loc[first, 'stock_id'].map(known)
+        factor = (df_p['Close'] - df_p['spread']) / prev
+        # 浮點誤差吸收成 1；明顯不合理的值 (資料錯誤) 也視為沒有調整
+        factor = factor.where((factor - 1).abs() > 1e-6, 1.0)
+        return factor.where((factor > 0) & (factor < 10), 1.0)
+
+    def _fill_bars(self, df):
+        """舊資料沒有開高低價與調整比：開高低以收盤代替，調整比視為 1，法人缺值視為 0"""
+        df = df.copy()
+        for col in ['Open', 'High', 'Low']:
+            df[col] = df[col].fillna(df['Close']) if col in df.columns else df['Close']
+        df['Adj_Factor'] = df['Adj_Factor'].fillna(1.0) if 'Adj_Factor' in df.columns else 1.0
+        for col in ['Foreign_BuySell', 'Trust_BuySell']:
+            df[col] = df[col].fillna(0) if col in df.columns else 0
+        return df
+
+    def _fetch_from_finmind(self, stock_id, start_date, end_date):
+        """FinMind 日K，整理成與 DB 相同的欄位；API 失敗時直接拋出例外讓呼叫端決定備援"""
+        df_p = self.api.taiwan_stock_daily(stock_id=stock_id, start_date=start_date, end_date=end_date)
+        if df_p.empty: return df_p
+        return self._normalize_finmind(df_p)
+
+    # 全市場補檔的檢查紀錄 (所有 DataLoader 共用)：日期 -> 上次查無資料的時間
+    _market_checked = {}
+    _market_lock = threading.Lock()
+
+    def _latest_bar_day(self):
+        """
+        目前最新一根可取得的日K是哪天：週末、開盤前與盤中都只到前一個營業日
+        refresh_market 在 TTL 內查過是空的日期 (國定假日、資料尚未公布) 也往前跳
+        """
+        now = datetime.now()
+        day = pd.Timestamp(now.date())
+        if day.weekday() >= 5 or now.hour < Config.MARKET_PUBLISH_HOUR:
+            day -= pd.offsets.BDay(1)
+        mono = time.monotonic()
+        with self._market_lock:
+            for _ in range(Config.MARKET_REFRESH_DAYS):
+                checked = self._market_checked.get(day.strftime('%Y-%m-%d'))
+                if checked is None or mono - checked >= Config.MARKET_REFRESH_TTL: break
+                day -= pd.offsets.BDay(1)
+        return day.normalize()
+
+    def _market_pending(self, target_date=None):
+        """
+        往回 MARKET_REFRESH_DAYS 個營業日中，DB 尚未整批入庫的日期
+        以區間內入庫檔數最多的那天為基準，不到 MARKET_COMPLETE_RATIO 的日期 (含完全沒有的) 都要補
+        """
+        end = pd.Timestamp(target_date).normalize() if target_date else self._latest_bar_day()
+        days = pd.bdate_range(end=end, periods=Config.MARKET_REFRESH_DAYS).strftime('%Y-%m-%d')
+        counts = self.db.count_by_date(days[0], days[-1])
+        full = max(counts.values(), default=0)
+        now = time.monotonic()
+        with self._market_lock:
+            return [
+                d for d in days
+                if (not full or counts.get(d, 0) < full * Config.MARKET_COMPLETE_RATIO)
+                and now - self._market_checked.get(d, -Config.MARKET_REFRESH_TTL) >= Config.MARKET_REFRESH_TTL
+            ]
+
+    def refresh_market(self, target_date=None):
+        """
+        收盤後的全市場補檔：每個缺少的交易日只打一次 FinMind (stock_id 留空 = 當日全市場)，整批 upsert
+        之後各檔的 fetch_data(force_update=True) 發現 DB 已是最新就不再逐檔請求
+        只寫入檢查區間內已有日K的股票：新股票仍由 fetch_data 抓完整歷史，
+        停更較久的股票交給逐檔增量從它自己的最後一天補起 (避免中間留下缺口)
+        依日期順序補，任何一天失敗就停止，剩下的日期同樣交給逐檔增量；回傳寫入筆數
+        """
+        pending = self._market_pending(target_date)
+        if not pending: return 0
+        end = pd.Timestamp(target_date).normalize() if target_date else self._latest_bar_day()
+        known = self.db.stock_ids(since=pd.bdate_range(end=end, periods=Config.MARKET_REFRESH_DAYS)[0].strftime('%Y-%m-%d'))
+        if not known: return 0
+
+        total, filled = 0, 0
+        for day in pending:
+            try:
+                df_p = self.api.taiwan_stock_daily(stock_id="", start_date=day, end_date=day)
+            except FinMindQuotaExceeded as e:
+                print(f"{Fore.YELLOW}[Data] FinMind 額度用盡，全市場補檔中止於 {day}: {e}")
+                break
+            except Exception as e:
+                print(f"{Fore.YELLOW}[Data] 全市場行情下載失敗，補檔中止於 {day}: {e}")
+                break
+
+            if df_p is None or df_p.empty:
+                # 假日或當日尚未收盤：記下時間，TTL 內不再重問
+                with self._market_lock:
+                    self._market_checked[day] = time.monotonic()
+                continue
+            df_p = self._normalize_finmind(df_p)
+            df_p = df_p[df_p['stock_id'].isin(known)]
+            self.db.save_many(df_p)
+            total += len(df_p)
+            filled += 1
+
+        if total:
+            print(f"{Fore.CYAN}[Data] 全市場補檔完成: {filled} 個交易日，共 {total} 筆")
+        return total
+
+    def _net_flows(self, df_f):
+        """FinMind 三大法人買賣表 (每檔每天每種法人一列) -> date, stock_id, Foreign_BuySell, Trust_BuySell (張)"""
+        df_f = df_f.copy()
+        df_f['net'] = (df_f['buy'] - df_f['sell']) / 1000
+        wide = df_f.pivot_table(index=['date', 'stock_id'], columns='name', values='net', aggfunc='sum', fill_value=0)
+        out = pd.DataFrame(index=wide.index)
+        for col, names in Config.FLOW_INVESTORS.items():
+            out[col] = wide.reindex(columns=names, fill_value=0).sum(axis=1)
+        out = out.reset_index()
+        out['date'] = pd.to_datetime(out['date'])
+        out['stock_id'] = out['stock_id'].astype(str)
+        return out
+
+    def _ingest(self, dataset, label, method, transform, save, stock_ids=None, end_date=None, backfill=True, history_start=None):
+        """
+        逐日資料集 (法人、融資融券) 的共用批次匯入
+        進度記在 ingest_log：每檔已入庫到哪一天，只補之後的區間
+        1. 進度在最近 MARKET_REFRESH_DAYS 個營業日內的股票：每個交易日打一次全市場 (stock_id 留空)
+        2. 其餘 (從未匯入或落後較久)：backfill=True 時每檔一個區間請求，從 history_start 或進度之後補起
+           掃描時請用 backfill=False，只做第 1 步，不會變成逐檔請求
+        method: FinMind 方法名；transform: 原始回傳 -> 入庫欄位；save: 寫入 DB 的函式
+        回傳寫入筆數
+        """
+        universe = [str(s) for s in stock_ids] if stock_ids is not None else sorted(self.db.stock_ids())
+        if not universe: return 0
+        fetch = getattr(self.api, method)
+        end = pd.Timestamp(end_date or date.today()).normalize()
+        end_str = end.strftime('%Y-%m-%d')
+        cutoff = pd.bdate_range(end=end, periods=Config.MARKET_REFRESH_DAYS + 1)[0].strftime('%Y-%m-%d')
+        marks = self.db.load_watermarks(dataset)
+        recent = [s for s in universe if marks.get(s, '') >= cutoff]
+        stale = [s for s in universe if marks.get(s, '') < cutoff]
+        total = 0
+
+        # 1. 全市場逐日：只補 DB 已有日K的交易日，當天還沒公布 (空表) 就停在那裡
+        if recent:
+            start = min(marks[s] for s in recent)
+            days = sorted(d for d in self.db.count_by_date(start, end_str) if d > start)
+            wanted = set(recent)
+            for day in days:
+                try:
+                    raw = fetch(stock_id="", start_date=day, end_date=day)
+                except Exception as e:
+                    print(f"{Fore.YELLOW}[Data] {label}下載失敗，匯入中止於 {day}: {e}")
+                    break
+                if raw is None or raw.empty: break
+                rows = transform(raw)
+                rows = rows[rows['stock_id'].isin(wanted)]
+                save(rows)
+                total += len(rows)
+                # 當天有日K的股票才推進進度 (停牌等缺K棒的留待之後補)
+                on_day = self.db.stock_ids(since=day, until=day)
+                self.db.save_watermarks(dataset, {s: day for s in recent if s in on_day and marks[s] < day})
+
+        # 2. 逐檔補歷史 (批次工作才做)
+        if stale and not backfill:
+            print(f"{Fore.YELLOW}[Data] {len(stale)} 檔{label}尚未回補，請執行批次匯入")
+        elif stale:
+            print(f"{Fore.YELLOW}[Data] 回補 {len(stale)} 檔{label}...")
+            history_start = history_start or Config.START_DATE
+
+            def _one(stock_id):
+                start = history_start
+                if stock_id in marks:
+                    start = max(start, (pd.Timestamp(marks[stock_id]) + timedelta(days=1)).strftime('%Y-%m-%d'))
+                try:
+                    raw = fetch(stock_id=stock_id, start_date=start, end_date=end_str)
+                except Exception as e:
+                    print(f"{Fore.YELLOW}[Data] {label}回補失敗 ({stock_id}): {e}")
+                    return 0
+                if raw is None or raw.empty: return 0
+                rows = transform(raw)
+                save(rows)
+                # 進度不超過 DB 中該檔最後一根日K (日K之後才到的資料下次再寫)
+                last_bar = self.db.get_last_date(stock_id)
+                if last_bar:
+                    self.db.save_watermarks(dataset, {stock_id: min(rows['date'].max().strftime('%Y-%m-%d'), last_bar)})
+                return len(rows)
+
+            with ThreadPoolExecutor(max_workers=min(Config.SCAN_WORKERS, len(stale))) as pool:
+                total += sum(pool.map(_one, stale))
+
+        if total:
+            print(f"{Fore.CYAN}[Data] {label}已匯入 {total} 筆")
+        return total
+
+    def refresh_flows(self, stock_ids=None, end_date=None, backfill=True):
+        """法人買賣超批次匯入 (寫回 daily_metrics 的 Foreign_BuySell / Trust_BuySell)，規則見 _ingest"""
+        return self._ingest(
+            "flows", "法人買賣超", "taiwan_stock_institutional_investors", self._net_flows, self.db.save_flows,
+            stock_ids, end_date, backfill,
+        )
+
+    def _margin_rows(self, df_m):
+        """FinMind 融資融券表 -> margin_metrics 的欄位"""
+        out = df_m.reindex(columns=['date', 'stock_id'] + self.db.MARGIN_COLUMNS).copy()
+        out['date'] = pd.to_datetime(out['date'])
+        out['stock_id'] = out['stock_id'].astype(str)
+        return out
+
+    def refresh_margin(self, stock_ids=None, end_date=None, backfill=True):
+        """
+        融資融券餘額批次匯入 (margin_metrics)，規則見 _ingest
+        籌碼評分只看最近幾天，逐檔回補只往回 MARGIN_LOOKBACK_DAYS 天
+        """
+        end = pd.Timestamp(end_date or date.today()).normalize()
+        history_start = (end - timedelta(days=Config.MARGIN_LOOKBACK_DAYS)).strftime('%Y-%m-%d')
+        return self._ingest(
+            "margin", "融資融券", "taiwan_stock_margin_purchase_short_sale", self._margin_rows, self.db.save_margin,
+            stock_ids, end_date, backfill, history_start,
+        )
+
+    def _fetch_delta(self, stock_id, cached):
+        """
+        只補抓資料庫最後一天之後的 K 棒，upsert 後與快取合併回傳
+        DB 已補到最新一根可取得的日K (見 _latest_bar_day) 時完全不打 API：
+        開盤前、盤中、週末與已知假日都不會為了必定是空的今天逐檔發請求
+        """
+        last_date = self.db.get_last_date(stock_id)
+        if last_date is None: return cached
+        start = pd.Timestamp(last_date) + timedelta(days=1)
+        end = self._latest_bar_day()
+        if start > end: return cached
+
+        start_str = start.strftime('%Y-%m-%d')
+        try:
+            delta = self._fetch_from_finmind(stock_id, start_str, end.strftime('%Y-%m-%d'))
+        except FinMindQuotaExceeded as e:
+            # gateway 退避重試後仍超過方案上限，改用 yfinance 補同一段
+            print(f"{Fore.YELLOW}[Data] FinMind 額度用盡 ({stock_id})，改用 yfinance: {e}")
+            delta = self._fetch_from_yfinance(stock_id, start_date=start_str)
+        except Exception as e:
+            print(f"{Fore.YELLOW}[Data] FinMind 增量失敗 ({stock_id})，改用 yfinance: {e}")
+            delta = self._fetch_from_yfinance(stock_id, start_date=start_str)
+
+        if delta is None or delta.empty: return cached
+        self.db.save_data(delta, stock_id)
+        merged = pd.concat([cached, delta], ignore_index=True)
+        merged = merged.drop_duplicates(subset='date', keep='last').sort_values('date').reset_index(drop=True)
+        return merged
+
+    def fetch_iter(self, stock_ids, force_update=False, workers=None, realtime=True):
+        """
+        多檔取得的串流版本：先用一個查詢讀出全部快取，再逐檔 (可併發) 補抓增量
+        每檔完成就 yield (stock_id, df 或 None)，順序依完成先後；提早關閉時取消尚未開始的工作
+        realtime=False 時不注入盤中價 (訓練資料只要已收盤的日K)
+        """
+        stock_ids = list(stock_ids)
+        cached = self.db.split_many(self.db.load_many(stock_ids, Config.START_DATE))
+        # 盤中先一次批次取得全部即時價，之後每檔的 fetch_data 直接命中報價快取
+        if realtime and self._in_quote_hours():
+            self.quotes.get_many(stock_ids)
+
+        def _one(stock_id):
+            try:
+                return self.fetch_data(stock_id, force_update, cached=cached.get(str(stock_id), pd.DataFrame()), realtime=realtime)
+            except Exception as e:
+                print(f"{Fore.RED}[Data] {stock_id} 取得失敗: {e}")
+                return None
+
+        workers = workers or Config.SCAN_WORKERS
+        if workers <= 1:
+            for stock_id in stock_ids:
+                yield stock_id, _one(stock_id)
+            return
+
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {pool.submit(_one, stock_id): stock_id for stock_id in stock_ids}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def fetch_many(self, stock_ids, force_update=False, workers=None, realtime=True):
+        """多檔一次取得，回傳依 stock_ids 順序的 {stock_id: df 或 None}"""
+        stock_ids = list(stock_ids)
+        fetched = dict(self.fetch_iter(stock_ids, force_update, workers, realtime))
+        return {stock_id: fetched.get(stock_id) for stock_id in stock_ids}
+
+    def fetch_data(self, stock_id, force_update=False, cached=None, realtime=True):
+        """
+        cached: 呼叫端已從 DB 讀好的快取 (fetch_many 批次查詢)，提供時不再重複查詢
+        realtime: 盤中是否把即時價注入最後一根 K 棒
+        """
         today_str = date.today().strftime('%Y-%m-%d')
-        df = None
-        if not force_update: df = self.db.load_data(stock_id, Config.START_DATE)
+        df = cached if cached is not None else self.db.load_data(stock_id, Config.START_DATE)
         
-        if df is None or df.empty or force_update:
+        if df is None or df.empty:
+            df = None
             try:
-                # 這裡可能會因為 FinMind 限流而失敗，失敗就安靜地去用 yfinance
-                df_p = self.api.taiwan_stock_daily(stock_id=stock_id, start_date=Config.START_DATE, end_date=today_str)
+                # 限流由 gateway 排隊與退避處理；真的失敗才改用 yfinance (並留下紀錄)
+                df_p = self._fetch_from_finmind(stock_id, Config.START_DATE, today_str)
                 if not df_p.empty:
-                    df_p['date'] = pd.to_datetime(df_p['date'])
-                    df_p = df_p.rename(columns={"close": "Close", "Trading_Volume": "Volume"})
-                    df_p = df_p[df_p['Close'] > 0]
-                    if not df_p.empty:
-                        df_p['Foreign_BuySell'] = 0
-                        df_p['Trust_BuySell'] = 0
-                        df = df_p
-                        self.db.save_data(df, stock_id)
-            except: pass 
+                    df = df_p
+                    self.db.save_data(df, stock_id)
+            except FinMindQuotaExceeded as e:
+                print(f"{Fore.YELLOW}[Data] FinMind 額度用盡 ({stock_id})，改用 yfinance: {e}")
+            except Exception as e:
+                print(f"{Fore.YELLOW}[Data] FinMind 下載失敗 ({stock_id})，改用 yfinance: {e}")
+        elif force_update:
+            # 強制更新只抓缺少的區間 (增量)，不再重抓整段歷史
+            df = self._fetch_delta(stock_id, df)
 
         if df is None or len(df) < 60:
             df_res = self._fetch_from_yfinance(stock_id)
@@ -128,12 +407,17 @@ class DataLoader:
                 self.db.save_data(df, stock_id)
 
         if df is None or df.empty: return None
+        df = self._fill_bars(df)
 
         # 4. 注入即時股價 (擴大時段)
-        now = datetime.now()
-        if 0 <= now.weekday() <= 4 and 8 <= now.hour <= 16:
+        if realtime and self._in_quote_hours():
             real = self._get_realtime_price(stock_id)
             if real and real > 0:
                 df.iloc[-1, df.columns.get_loc('Close')] = real
+                # 盤中價可能突破當日高低，真實波幅才算得正確
+                # 最後一根還是前一個交易日時不動高低，否則兩個交易日會被併成一根，ATR 虛胖
+                if pd.Timestamp(df['date'].iloc[-1]).normalize() == pd.Timestamp(date.today()):
+                    df.iloc[-1, df.columns.get_loc('High')] = max(df['High'].iloc[-1], real)
+                    df.iloc[-1, df.columns.get_loc('Low')] = min(df['Low'].iloc[-1], real)
         
         return df
\ No newline at end of file
@@ -1,8 +1,11 @@
-# utils/db_manager.py (V2 - Thread Safe)
+# utils/db_manager.py (V4 - Pooled WAL Connections + Optional Parquet)
 import sqlite3
+import threading
 import pandas as pd
+import numpy as np
 import os
 from config.settings import Config
+from utils.parquet_store import get_parquet_store
 import colorama
 from colorama import Fore
 
@@ -10,19 +13,38 @@ colorama.init(autoreset=True)
 
 class DBManager:
     def __init__(self, db_name="market_data.db"):
-        # 不再儲存 self.conn，只儲存路徑
         self.db_path = os.path.join(Config.DATA_DIR, db_name)
+        # 每個執行緒各自持有一條長連線，執行緒結束時隨 thread-local 一起釋放
+        self._local = threading.local()
         self._init_db()
+        # 選用的欄式儲存：寫入時雙寫，批次讀取優先走 Parquet
+        self.columnar = get_parquet_store(value_columns=self.VALUE_COLUMNS) if Config.STORAGE_BACKEND == "parquet" else None
 
     def _get_conn(self):
         """
-        每次都返回一個新的資料庫連線。
-        check_same_thread=False 避免在多線程環境下，即便我們開啟新連線，底層仍被卡住。
+        回傳目前執行緒的長連線 (第一次呼叫時建立並設定 pragma)
+        WAL 模式讓掃描執行緒寫入時，Streamlit UI 仍可同時讀取而不互鎖
         """
-        return sqlite3.connect(self.db_path, check_same_thread=False)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={Config.DB_MMAP_SIZE}")
+            conn.execute(f"PRAGMA cache_size=-{Config.DB_CACHE_KB}")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """關閉目前執行緒的連線"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
 
     def _init_db(self):
-        """初始化資料庫表結構，使用 context manager 確保連線關閉"""
+        """初始化資料庫表結構"""
         try:
             with self._get_conn() as conn:
                 cursor = conn.cursor()
@@ -34,45 +56,392 @@ class DBManager:
                         Volume INTEGER,
                         Foreign_BuySell REAL,
                         Trust_BuySell REAL,
+                        Open REAL,
+                        High REAL,
+                        Low REAL,
+                        Adj_Factor REAL,
                         PRIMARY KEY (date, stock_id)
                     )
                 ''')
+                self._migrate_columns(cursor)
+                self._ensure_covering_index(cursor)
+                # 代號 -> 交易所/市場別/上市狀態/商品類型 的對照表 (SymbolIndex 使用)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS symbols (
+                        stock_id TEXT PRIMARY KEY,
+                        exchange TEXT,
+                        board TEXT,
+                        status TEXT,
+                        instrument TEXT,
+                        name TEXT,
+                        updated TEXT
+                    )
+                ''')
+                # 融資融券餘額 (張)：籌碼評分依股票批次讀取，主鍵以 stock_id 開頭
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS margin_metrics (
+                        stock_id TEXT,
+                        date TEXT,
+                        {", ".join(f"{c} REAL" for c in self.MARGIN_COLUMNS)},
+                        PRIMARY KEY (stock_id, date)
+                    )
+                ''')
+                # 各批次匯入資料集 (法人買賣超、融資融券) 每檔已入庫到哪一天
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS ingest_log (
+                        dataset TEXT,
+                        stock_id TEXT,
+                        last_date TEXT,
+                        PRIMARY KEY (dataset, stock_id)
+                    )
+                ''')
                 conn.commit()
         except Exception as e:
             print(f"{Fore.RED} [DB ERROR] 初始化失敗: {e}")
 
+    # 寫入欄位 (不含主鍵)；Adj_Factor = 當日參考價 / 前日收盤 (除權息、減資日才不是 1)
+    VALUE_COLUMNS = ['Close', 'Volume', 'Foreign_BuySell', 'Trust_BuySell', 'Open', 'High', 'Low', 'Adj_Factor']
+    # 法人買賣超 (張) 由 save_flows 另外寫入；日K upsert 只在新增列時寫入預設值，不覆蓋已入庫的數字
+    FLOW_COLUMNS = ['Foreign_BuySell', 'Trust_BuySell']
+    # 這些欄位新值為 NULL 時保留舊值 (例如 yfinance 備援沒有調整比，不洗掉 FinMind 算好的)
+    COALESCE_COLUMNS = ['Open', 'High', 'Low', 'Adj_Factor']
+
+    def _migrate_columns(self, cursor):
+        """舊版資料庫只有收盤/成交量/法人欄位，補上新增的欄位 (舊資料為 NULL)"""
+        have = {row[1] for row in cursor.execute("PRAGMA table_info(daily_metrics)")}
+        for col in self.VALUE_COLUMNS:
+            if col not in have:
+                cursor.execute(f"ALTER TABLE daily_metrics ADD COLUMN {col} REAL")
+
+    def _ensure_covering_index(self, cursor):
+        """
+        (stock_id, date) 開頭並包含所有數值欄位的覆蓋索引
+        load_many / load_data 只掃索引就能回傳結果，不必回表
+        欄位增加時舊索引不再覆蓋，換成新名稱重建
+        """
+        cursor.execute("DROP INDEX IF EXISTS idx_daily_stock_date")
+        cols = ", ".join(['stock_id', 'date'] + self.VALUE_COLUMNS)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_daily_stock_date_ohlc ON daily_metrics ({cols})")
+
+    def _upsert_sql(self):
+        cols = ['date', 'stock_id'] + self.VALUE_COLUMNS
+        updates = ", ".join(
+            f"{c} = COALESCE(excluded.{c}, {c})" if c in self.COALESCE_COLUMNS else f"{c} = excluded.{c}"
+            for c in self.VALUE_COLUMNS if c not in self.FLOW_COLUMNS
+        )
+        return f"""
+            INSERT INTO daily_metrics ({', '.join(cols)})
+            VALUES ({', '.join('?' for _ in cols)})
+            ON CONFLICT(date, stock_id) DO UPDATE SET {updates}
+        """
+
+    def _to_rows(self, df):
+        """DataFrame -> sqlite3 可綁定的 tuple 清單 (numpy 型別轉成 Python 原生型別，NaN 轉 NULL)"""
+        df = df.astype(object).where(pd.notna(df), None)
+        return list(df.itertuples(index=False, name=None))
+
     def save_data(self, df, stock_id):
-        """將 Dataframe 存入 SQL，每次都開啟新連線"""
-        if df.empty: return
-        
-        save_df = df[['date', 'Close', 'Volume', 'Foreign_BuySell', 'Trust_BuySell']].copy()
-        save_df['stock_id'] = stock_id
-        save_df['date'] = save_df['date'].dt.strftime('%Y-%m-%d')
-        
+        """
+        將 Dataframe upsert 進 SQL：(date, stock_id) 重複時以新資料覆蓋
+        單一交易 + executemany 綁定參數，只寫入傳進來的這一段 (delta)
+        """
+        if df is None or df.empty: return
+        save_df = df.copy()
+        save_df['stock_id'] = str(stock_id)
+        self.save_many(save_df)
+
+    def save_many(self, df):
+        """
+        多檔一次 upsert (df 需含 stock_id 欄，例如全市場單日行情)
+        所有列在同一個交易內 executemany；Parquet 依股票分區各寫一次
+        """
+        if df is None or df.empty: return
+
+        save_df = df.reindex(columns=['date', 'stock_id'] + self.VALUE_COLUMNS)
+        save_df['stock_id'] = save_df['stock_id'].astype(str)
+        save_df['date'] = pd.to_datetime(save_df['date']).dt.strftime('%Y-%m-%d')
+
         try:
-            with self._get_conn() as conn: # 關鍵：新連線
-                # 使用 replace 模式，如果有重複日期就覆蓋
-                save_df.to_sql('daily_metrics', conn, if_exists='append', index=False, method='multi')
-                # print(f"{Fore.GREEN}[DB] 成功儲存 {len(save_df)} 筆數據至資料庫") # 避免 log 過長
-        except sqlite3.IntegrityError:
-            # 數據已存在，跳過
-            pass
+            with self._get_conn() as conn: # with 區塊結束時一次 commit (連線本身保留重用)
+                conn.executemany(self._upsert_sql(), self._to_rows(save_df))
         except Exception as e:
              print(f"{Fore.RED}[DB ERROR] 寫入數據失敗: {e}")
 
-    def load_data(self, stock_id, start_date):
-        """從 SQL 讀取數據，每次都開啟新連線"""
+        if self.columnar is not None:
+            try:
+                for stock_id, group in save_df.groupby('stock_id', sort=False):
+                    self.columnar.write(group, stock_id, preserve=self.FLOW_COLUMNS, coalesce=self.COALESCE_COLUMNS)
+            except Exception as e:
+                print(f"{Fore.RED}[DB ERROR] Parquet 寫入失敗: {e}")
+
+    def save_flows(self, df):
+        """
+        法人買賣超寫回既有的日K列 (df: date, stock_id, Foreign_BuySell, Trust_BuySell)
+        只更新這兩欄；DB 還沒有該日K的列直接略過，之後由 ingest_log 的進度重新補
+        """
+        if df is None or df.empty: return
+
+        save_df = df[['date', 'stock_id'] + self.FLOW_COLUMNS].copy()
+        save_df['stock_id'] = save_df['stock_id'].astype(str)
+        save_df['date'] = pd.to_datetime(save_df['date']).dt.strftime('%Y-%m-%d')
+        sets = ", ".join(f"{c} = ?" for c in self.FLOW_COLUMNS)
+        sql = f"UPDATE daily_metrics SET {sets} WHERE date = ? AND stock_id = ?"
+        rows = self._to_rows(save_df[self.FLOW_COLUMNS + ['date', 'stock_id']])
+
+        try:
+            with self._get_conn() as conn:
+                conn.executemany(sql, rows)
+        except Exception as e:
+            print(f"{Fore.RED}[DB ERROR] 寫入法人資料失敗: {e}")
+
+        if self.columnar is not None:
+            try:
+                for stock_id, group in save_df.groupby('stock_id', sort=False):
+                    self.columnar.update(group, stock_id)
+            except Exception as e:
+                print(f"{Fore.RED}[DB ERROR] Parquet 寫入失敗: {e}")
+
+    MARGIN_COLUMNS = [
+        'MarginPurchaseTodayBalance', 'MarginPurchaseYesterdayBalance',
+        'ShortSaleTodayBalance', 'ShortSaleYesterdayBalance',
+    ]
+
+    def save_margin(self, df):
+        """upsert 融資融券餘額 (df: date, stock_id + MARGIN_COLUMNS)"""
+        if df is None or df.empty: return
+        cols = ['stock_id', 'date'] + self.MARGIN_COLUMNS
+        save_df = df.reindex(columns=cols)
+        save_df['stock_id'] = save_df['stock_id'].astype(str)
+        save_df['date'] = pd.to_datetime(save_df['date']).dt.strftime('%Y-%m-%d')
+        updates = ", ".join(f"{c} = excluded.{c}" for c in self.MARGIN_COLUMNS)
+        sql = f"""
+            INSERT INTO margin_metrics ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})
+            ON CONFLICT(stock_id, date) DO UPDATE SET {updates}
+        """
+        try:
+            with self._get_conn() as conn:
+                conn.executemany(sql, self._to_rows(save_df))
+        except Exception as e:
+            print(f"{Fore.RED}[DB ERROR] 寫入融資融券失敗: {e}")
+
+    def load_margin(self, stock_ids, start_date=None):
+        """多檔融資融券一次查詢 -> long DataFrame (依 stock_id, date 排序)"""
+        stock_ids = [str(s) for s in dict.fromkeys(stock_ids)]
+        cols = ['date', 'stock_id'] + self.MARGIN_COLUMNS
+        frames = []
         try:
-            with self._get_conn() as conn: # 關鍵：新連線
+            conn = self._get_conn()
+            for i in range(0, len(stock_ids), 500):
+                chunk = stock_ids[i:i + 500]
                 query = f"""
+                    SELECT {', '.join(cols)} FROM margin_metrics
+                    WHERE stock_id IN ({', '.join('?' for _ in chunk)}) AND date >= ?
+                    ORDER BY stock_id, date
+                """
+                frames.append(pd.read_sql(query, conn, params=chunk + [str(start_date or '0000-00-00')]))
+        except Exception as e:
+            print(f"{Fore.RED}[DB ERROR] 讀取融資融券失敗: {e}")
+            return pd.DataFrame(columns=cols)
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=cols)
+        df['date'] = pd.to_datetime(df['date'])
+        return df
+
+    def load_watermarks(self, dataset):
+        """ingest_log -> {stock_id: 已入庫的最後日期}"""
+        try:
+            rows = self._get_conn().execute(
+                "SELECT stock_id, last_date FROM ingest_log WHERE dataset = ?", (dataset,)
+            ).fetchall()
+        except Exception as e:
+            print(f"{Fore.RED}[DB ERROR] 讀取匯入進度失敗: {e}")
+            return {}
+        return dict(rows)
+
+    def save_watermarks(self, dataset, marks):
+        """marks: {stock_id: 日期}；只會往後推進，不會倒退"""
+        if not marks: return
+        sql = """
+            INSERT INTO ingest_log (dataset, stock_id, last_date) VALUES (?, ?, ?)
+            ON CONFLICT(dataset, stock_id) DO UPDATE SET last_date = MAX(last_date, excluded.last_date)
+        """
+        try:
+            with self._get_conn() as conn:
+                conn.executemany(sql, [(dataset, str(k), str(v)) for k, v in marks.items()])
+        except Exception as e:
+            print(f"{Fore.RED}[DB ERROR] 寫入匯入進度失敗: {e}")
+
+    def load_data(self, stock_id, start_date):
+        """從 SQL 讀取數據 (參數綁定，不再拼接 SQL 字串)；啟用 Parquet 且該股已遷移時讀欄式檔"""
+        if self.columnar is not None and str(stock_id) in self.columnar.migrated():
+            df = self.columnar.load(stock_id, start_date)
+            if not df.empty: return df
+        try:
+            with self._get_conn() as conn:
+                query = """
                     SELECT * FROM daily_metrics 
-                    WHERE stock_id = '{stock_id}' AND date >= '{start_date}'
+                    WHERE stock_id = ? AND date >= ?
                     ORDER BY date ASC
                 """
-                df = pd.read_sql(query, conn)
+                df = pd.read_sql(query, conn, params=(str(stock_id), str(start_date)))
                 if not df.empty:
                     df['date'] = pd.to_datetime(df['date'])
                 return df
         except Exception as e:
             print(f"{Fore.RED}[DB ERROR] 讀取數據失敗: {e}")
-            return pd.DataFrame()
\ No newline at end of file
+            return pd.DataFrame()
+
+    def get_last_date(self, stock_id):
+        """資料庫中該股票最後一筆 K 棒的日期 (YYYY-MM-DD)，沒有資料回傳 None"""
+        try:
+            with self._get_conn() as conn:
+                row = conn.execute(
+                    "SELECT MAX(date) FROM daily_metrics WHERE stock_id = ?", (str(stock_id),)
+                ).fetchone()
+                return row[0] if row else None
+        except Exception as e:
+            print(f"{Fore.RED}[DB ERROR] 讀取最後日期失敗: {e}")
+            return None
+
+    def stock_ids(self, since=None, until=None):
+        """DB 中 [since, until] 區間內有日K的股票代號"""
+        try:
+            rows = self._get_conn().execute(
+                "SELECT DISTINCT stock_id FROM daily_metrics WHERE date >= ? AND date <= ?",
+                (str(since or '0000-00-00'), str(until or '9999-99-99')),
+            )
+            return {r[0] for r in rows}
+        except Exception as e:
+            print(f"{Fore.RED}[DB ERROR] 讀取股票清單失敗: {e}")
+            return set()
+
+    def prev_closes(self, stock_ids, before):
+        """各檔在 before 之前 (不含) 最後一天的收盤 -> {stock_id: Close}"""
+        stock_ids = [str(s) for s in dict.fromkeys(stock_ids)]
+        out = {}
+        try:
+            conn = self._get_conn()
+            for i in range(0, len(stock_ids), 500):
+                chunk = stock_ids[i:i + 500]
+                query = f"""
+                    SELECT m.stock_id, m.Close FROM daily_metrics m
+                    JOIN (
+                        SELECT stock_id, MAX(date) AS d FROM daily_metrics
+                        WHERE stock_id IN ({', '.join('?' for _ in chunk)}) AND date < ?
+                        GROUP BY stock_id
+                    ) t ON m.stock_id = t.stock_id AND m.date = t.d
+                """
+                out.update(conn.execute(query, chunk + [str(before)]).fetchall())
+        except Exception as e:
+            print(f"{Fore.RED}[DB ERROR] 讀取前日收盤失敗: {e}")
+        return out
+
+    def count_by_date(self, start_date, end_date):
+        """區間內每個交易日已入庫的股票數 -> {YYYY-MM-DD: 筆數} (走 (date, stock_id) 主鍵)"""
+        try:
+            rows = self._get_conn().execute(
+                "SELECT date, COUNT(*) FROM daily_metrics WHERE date >= ? AND date <= ? GROUP BY date",
+                (str(start_date), str(end_date)),
+            ).fetchall()
+        except Exception as e:
+            print(f"{Fore.RED}[DB ERROR] 讀取每日筆數失敗: {e}")
+            return {}
+        return dict(rows)
+
+    def load_many(self, stock_ids, start_date=None, end_date=None, as_arrays=False, use_columnar=True):
+        """
+        一次查詢多檔股票
+        as_arrays=False: 回傳 long DataFrame (依 stock_id, date 排序)
+        as_arrays=True : 回傳 {stock_id: {欄位: np.ndarray}}
+        啟用 Parquet 時已遷移的股票讀欄式檔，其餘 (未遷移、只有增量分區) 回 SQLite 查
+        """
+        stock_ids = [str(s) for s in dict.fromkeys(stock_ids)]
+        if self.columnar is None or not use_columnar:
+            return self._load_many_sqlite(stock_ids, start_date, end_date, as_arrays)
+
+        migrated = self.columnar.migrated()
+        done = [s for s in stock_ids if s in migrated]
+        if not done: return self._load_many_sqlite(stock_ids, start_date, end_date, as_arrays)
+        got = self.columnar.load_many(done, start_date, end_date, as_arrays)
+        have = set(got.keys()) if as_arrays else set(got['stock_id'].unique())
+        missing = [s for s in stock_ids if s not in have]
+        if not missing: return got
+
+        rest = self._load_many_sqlite(missing, start_date, end_date, as_arrays)
+        if as_arrays:
+            got.update(rest)
+            return got
+        if got.empty: return rest
+        return pd.concat([got, rest], ignore_index=True).sort_values(['stock_id', 'date'], kind='mergesort', ignore_index=True)
+
+    def _load_many_sqlite(self, stock_ids, start_date=None, end_date=None, as_arrays=False):
+        """走 (stock_id, date) 覆蓋索引的批次查詢"""
+        cols = ['date', 'stock_id'] + self.VALUE_COLUMNS
+        frames = []
+        try:
+            conn = self._get_conn()
+            # SQLite 單一語句的參數數量有上限，大清單分段查詢
+            for i in range(0, len(stock_ids), 500):
+                chunk = stock_ids[i:i + 500]
+                query = f"""
+                    SELECT {', '.join(cols)} FROM daily_metrics
+                    WHERE stock_id IN ({', '.join('?' for _ in chunk)})
+                      AND date >= ? AND date <= ?
+                    ORDER BY stock_id, date
+                """
+                params = chunk + [str(start_date or '0000-00-00'), str(end_date or '9999-99-99')]
+                frames.append(pd.read_sql(query, conn, params=params))
+        except Exception as e:
+            print(f"{Fore.RED}[DB ERROR] 批次讀取失敗: {e}")
+            return {} if as_arrays else pd.DataFrame(columns=cols)
+
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=cols)
+        if len(frames) > 1:
+            df = df.sort_values(['stock_id', 'date'], kind='mergesort', ignore_index=True)
+        df['date'] = pd.to_datetime(df['date'])
+        if not as_arrays: return df
+
+        out = {}
+        if df.empty: return out
+        # 已依 stock_id 排序，找出每檔的起訖位置後直接切片
+        uniq, starts = np.unique(df['stock_id'].to_numpy(), return_index=True)
+        bounds = np.append(starts, len(df))
+        arrays = {c: df[c].to_numpy() for c in cols if c != 'stock_id'}
+        for j, stock_id in enumerate(uniq):
+            a, b = bounds[j], bounds[j + 1]
+            out[stock_id] = {c: v[a:b] for c, v in arrays.items()}
+        return out
+
+    def split_many(self, df):
+        """把 load_many 的 long DataFrame 拆成 {stock_id: df}"""
+        if df.empty: return {}
+        return {stock_id: g.reset_index(drop=True) for stock_id, g in df.groupby('stock_id', sort=False)}
+
+    SYMBOL_COLUMNS = ['stock_id', 'exchange', 'board', 'status', 'instrument', 'name', 'updated']
+
+    def load_symbols(self):
+        """讀出整張 symbols 對照表 -> {stock_id: {欄位: 值}}"""
+        try:
+            rows = self._get_conn().execute(f"SELECT {', '.join(self.SYMBOL_COLUMNS)} FROM symbols").fetchall()
+        except Exception as e:
+            print(f"{Fore.RED}[DB ERROR] 讀取代號對照表失敗: {e}")
+            return {}
+        return {r[0]: dict(zip(self.SYMBOL_COLUMNS, r)) for r in rows}
+
+    def save_symbols(self, records):
+        """
+        upsert 代號對照表；新值為 NULL 的欄位保留舊值
+        (查價時只知道交易所，不會把批次匯入的市場別/類型洗掉)
+        """
+        if not records: return
+        cols = self.SYMBOL_COLUMNS
+        updates = ", ".join(f"{c} = COALESCE(excluded.{c}, {c})" for c in cols[1:])
+        sql = f"""
+            INSERT INTO symbols ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})
+            ON CONFLICT(stock_id) DO UPDATE SET {updates}
+        """
+        rows = [tuple(r.get(c) for c in cols) for r in records]
+        try:
+            with self._get_conn() as conn:
+                conn.executemany(sql, rows)
+        except Exception as e:
+            print(f"{Fore.RED}[DB ERROR] 寫入代號對照表失敗: {e}")
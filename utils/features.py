@@ -0,0 +1,335 @@
+# utils/features.py (Shared Feature Engine)
+import numpy as np
+import pandas as pd
+from config.settings import Config
+
+# numba 為選用依賴：有裝就用編譯過的 EWM 迴圈，沒裝就走純 NumPy 版本
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# 訓練與推論共用的特徵欄位 (順序與舊版 _preprocess / _add_features 相同)
+FEATURE_COLUMNS = [
+    "log_volume", "pct_change",
+    "MA5", "Bias5", "MA20", "Bias20", "MA60", "Bias60",
+    "RSI6", "MACD", "MACD_signal", "MACD_hist", "K", "D",
+    "BB_std", "BB_upper", "BB_lower", "BB_width", "Vol_20"
+]
+
+def _rolling(x, window, fn):
+    """
+    x: (tickers, days)，對最後一軸做長度 window 的滑動運算
+    與 pandas rolling(window) 相同：窗口內只要有 NaN (含左側補齊區) 結果就是 NaN
+    """
+    out = np.full(x.shape, np.nan)
+    if x.shape[1] >= window:
+        win = np.lib.stride_tricks.sliding_window_view(x, window, axis=1)
+        with np.errstate(invalid="ignore"):
+            out[:, window - 1:] = fn(win)
+    return out
+
+def _ewm_numpy(x, alpha):
+    """pandas ewm(adjust=False) 的逐日遞迴，同時對所有股票向量化"""
+    n, t = x.shape
+    out = np.empty_like(x)
+    weighted = x[:, 0].copy()
+    old_wt = np.ones(n)
+    out[:, 0] = weighted
+    for i in range(1, t):
+        cur = x[:, i]
+        obs = ~np.isnan(cur)
+        started = ~np.isnan(weighted)
+        # 已起算的序列遇到 NaN 時只衰減權重 (ignore_na=False)
+        old_wt = np.where(started, old_wt * (1 - alpha), old_wt)
+        mix = started & obs
+        weighted = np.where(mix, (old_wt * weighted + alpha * cur) / (old_wt + alpha), weighted)
+        old_wt = np.where(mix, 1.0, old_wt)
+        weighted = np.where(~started & obs, cur, weighted)
+        out[:, i] = weighted
+    return out
+
+if njit is not None:
+    @njit(cache=True)
+    def _ewm_numba(x, alpha):
+        n, t = x.shape
+        out = np.empty_like(x)
+        for r in range(n):
+            weighted = x[r, 0]
+            old_wt = 1.0
+            out[r, 0] = weighted
+            for i in range(1, t):
+                cur = x[r, i]
+                if weighted == weighted:
+                    old_wt *= (1 - alpha)
+                    if cur == cur:
+                        weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+                        old_wt = 1.0
+                elif cur == cur:
+                    weighted = cur
+                out[r, i] = weighted
+        return out
+else:
+    _ewm_numba = None
+
+def ewm(x, span=None, com=None):
+    """等同 pandas ewm(span=.. / com=.., adjust=False).mean()，x: (tickers, days)"""
+    alpha = 2.0 / (span + 1.0) if span is not None else 1.0 / (1.0 + com)
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    if _ewm_numba is not None:
+        return _ewm_numba(x, alpha)
+    return _ewm_numpy(x, alpha)
+
+def _pad_mask(shape, lengths=None, close=None):
+    """
+    左側補齊區的遮罩：有 lengths (各檔實際長度，_stack 右對齊的依據) 就以長度推算
+    沒給時退回「開頭連續的 NaN」；序列中間的缺值不算補齊區，照 pandas 的規則往下算
+    """
+    if lengths is None:
+        return np.logical_and.accumulate(np.isnan(close), axis=1)
+    t = shape[1]
+    return np.arange(t)[None, :] < (t - np.asarray(lengths))[:, None]
+
+def compute_feature_block(close, volume, lengths=None):
+    """
+    一次算出整個特徵區塊
+    close / volume: (tickers, days) 的 float64 陣列，長度不足的股票在左側以 NaN 補齊
+    lengths: 各檔的實際長度 (與 _stack 的輸入對應)
+    回傳 {欄位名: (tickers, days) 陣列}
+    """
+    close = np.asarray(close, dtype=np.float64)
+    volume = np.asarray(volume, dtype=np.float64)
+    pad = _pad_mask(close.shape, lengths, close)
+    f = {}
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f["log_volume"] = np.log1p(volume)
+
+        prev = np.full(close.shape, np.nan)
+        prev[:, 1:] = close[:, :-1]
+        delta = close - prev
+        f["pct_change"] = close / prev - 1
+
+        for w in [5, 20, 60]:
+            ma = _rolling(close, w, lambda v: v.mean(axis=-1))
+            f[f"MA{w}"] = ma
+            f[f"Bias{w}"] = (close - ma) / (ma + 1e-9)
+
+        # pandas 的 delta.where(...) 會把第一筆 NaN 變成 0，補齊區則維持 NaN
+        gain = np.where(delta > 0, delta, 0.0)
+        loss = np.where(delta < 0, -delta, 0.0)
+        gain[pad] = np.nan
+        loss[pad] = np.nan
+        avg_gain = _rolling(gain, 6, lambda v: v.mean(axis=-1))
+        avg_loss = _rolling(loss, 6, lambda v: v.mean(axis=-1))
+        rs = avg_gain / (avg_loss + 1e-9)
+        f["RSI6"] = 100 - (100 / (1 + rs))
+
+        macd = ewm(close, span=12) - ewm(close, span=26)
+        f["MACD"] = macd
+        f["MACD_signal"] = ewm(macd, span=9)
+        f["MACD_hist"] = macd - f["MACD_signal"]
+
+        low_min = _rolling(close, 9, lambda v: v.min(axis=-1))
+        high_max = _rolling(close, 9, lambda v: v.max(axis=-1))
+        rsv = (close - low_min) / (high_max - low_min + 1e-9) * 100
+        f["K"] = ewm(rsv, com=2)
+        f["D"] = ewm(f["K"], com=2)
+
+        ma20 = f["MA20"]
+        bb_std = _rolling(close, 20, lambda v: v.std(axis=-1, ddof=1))
+        f["BB_std"] = bb_std
+        f["BB_upper"] = ma20 + (bb_std * 2)
+        f["BB_lower"] = ma20 - (bb_std * 2)
+        f["BB_width"] = (f["BB_upper"] - f["BB_lower"]) / (ma20 + 1e-9)
+        f["Vol_20"] = _rolling(f["pct_change"], 20, lambda v: v.std(axis=-1, ddof=1))
+
+    # 補齊區不該有任何值
+    for v in f.values():
+        v[pad] = np.nan
+    return f
+
+def _stack(frames, col):
+    """把多檔股票的欄位右對齊疊成 (tickers, days)，左側補 NaN"""
+    t = max(len(df) for df in frames)
+    out = np.full((len(frames), t), np.nan)
+    for i, df in enumerate(frames):
+        if len(df): out[i, t - len(df):] = df[col].to_numpy(dtype=np.float64)
+    return out
+
+def _fill(x):
+    """inf -> NaN 後沿時間軸 ffill 再 bfill，最後補 0 (等同 DataFrame.ffill().bfill().fillna(0))"""
+    x = np.where(np.isinf(x), np.nan, x)
+    n, t = x.shape
+    rows = np.arange(n)[:, None]
+    idx = np.where(~np.isnan(x), np.arange(t), 0)
+    x = x[rows, np.maximum.accumulate(idx, axis=1)]
+    idx = np.where(~np.isnan(x), np.arange(t), t - 1)
+    x = x[rows, np.minimum.accumulate(idx[:, ::-1], axis=1)[:, ::-1]]
+    return np.nan_to_num(x, nan=0.0)
+
+def add_features_many(dfs, group_ids=None):
+    """
+    dfs: {stock_id: df} -> {stock_id: 加好特徵的 df}
+    所有股票一次向量化計算；group_ids 可指定每檔的 group_id (預設為 stock_id 本身)
+    """
+    if not dfs: return {}
+    keys = list(dfs.keys())
+    frames = [dfs[k] for k in keys]
+    block = compute_feature_block(_stack(frames, "Close"), _stack(frames, "Volume"), [len(df) for df in frames])
+    block = {col: _fill(block[col]) for col in FEATURE_COLUMNS}
+    t = block["MA5"].shape[1]
+    min_date = pd.Timestamp(Config.START_DATE)
+
+    out = {}
+    for i, (stock_id, df) in enumerate(zip(keys, frames)):
+        data = df.drop(columns=[c for c in ["time_idx", "group_id"] + FEATURE_COLUMNS if c in df.columns])
+        data['date'] = pd.to_datetime(data['date'])
+        data['time_idx'] = (data['date'] - min_date).dt.days
+        data['group_id'] = str(group_ids[stock_id] if group_ids else stock_id)
+        feats = pd.DataFrame({col: block[col][i, t - len(df):] for col in FEATURE_COLUMNS}, index=data.index)
+        data = pd.concat([data, feats], axis=1)
+
+        # 原始欄位 (Close / 法人等) 若有缺值，才走完整的 pandas 補值
+        num = data.select_dtypes(include=[np.number])
+        if num.isna().values.any() or np.isinf(num.values).any():
+            data = data.replace([np.inf, -np.inf], np.nan)
+            data = data.ffill().bfill().fillna(0)
+        out[stock_id] = data
+    return out
+
+def add_features(df, group_id):
+    """單檔版本：等同舊的 TechAgent._preprocess / UniversalModelTrainer._add_features"""
+    return add_features_many({group_id: df})[group_id]
+
+def adjustment_factors(adj):
+    """
+    adj: (tickers, days) 每日的除權息/減資調整比 (當日參考價 / 前日收盤，平常為 1，缺值視為 1)
+    回傳每一天要乘上的還原係數 = 之後所有調整比的連乘 (最後一天為 1)
+    """
+    adj = np.where(np.isnan(adj), 1.0, adj)
+    tail = np.cumprod(adj[:, ::-1], axis=1)[:, ::-1]
+    out = np.ones(adj.shape)
+    out[:, :-1] = tail[:, 1:]
+    return out
+
+def true_range(high, low, close):
+    """
+    (tickers, days) 的真實波幅 max(高-低, |高-昨收|, |低-昨收|)
+    缺高低價 (舊資料) 的日子以收盤價代替，退化成收盤價差
+    """
+    high = np.where(np.isnan(high), close, high)
+    low = np.where(np.isnan(low), close, low)
+    prev = np.full(close.shape, np.nan)
+    prev[:, 1:] = close[:, :-1]
+    # fmax 忽略 NaN：第一天沒有昨收時就是當日高低差
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev), np.abs(low - prev)))
+    tr[np.isnan(close)] = np.nan
+    return tr
+
+def average_true_range(high, low, close, period=None):
+    """Wilder ATR (等同 ewm(alpha=1/period, adjust=False))，所有股票一次計算"""
+    period = period or Config.ATR_PERIOD
+    return ewm(true_range(high, low, close), com=period - 1)
+
+def atr_many(dfs, period=None):
+    """
+    dfs: {stock_id: 日K df} -> {stock_id: 最新一天的 ATR (還原權息後的價格單位)}
+    沒有 High / Low / Adj_Factor 欄位的 df 以收盤價計算
+    """
+    if not dfs: return {}
+    keys = list(dfs.keys())
+    frames = [dfs[k] for k in keys]
+    close = _stack(frames, "Close")
+    cols = {c: _stack([df if c in df.columns else df.assign(**{c: np.nan}) for df in frames], c)
+            for c in ("High", "Low", "Adj_Factor")}
+    # 除權息日的跳空不是波動：先把之前的價格還原到與最新價同一基準
+    factor = adjustment_factors(cols["Adj_Factor"])
+    atr = average_true_range(cols["High"] * factor, cols["Low"] * factor, close * factor, period)
+    return {k: float(atr[i, -1]) for i, k in enumerate(keys)}
+
+def atr(df, period=None):
+    """單檔版本的 atr_many"""
+    return atr_many({0: df}, period)[0]
+
+class IncrementalFeatureState:
+    """
+    單檔股票「截至昨收」的指標狀態 (滾動窗口、EWM 累加器、KD)
+    盤中即時價進來時，用 peek() 以固定成本算出今日這一根的全部特徵，不必重算整段歷史
+    歷史至少需要 60 根 (MA60 的窗口)，不足時 from_history() 回傳 None
+    """
+    WINDOW = 60
+
+    def __init__(self, close, volume):
+        close = np.asarray(close, dtype=np.float64)
+        # 只保留最長窗口所需的最後 59 根收盤
+        self.closes = close[-(self.WINDOW - 1):].copy()
+        self.prev_close = close[-1]
+        self.prev_volume = float(np.asarray(volume, dtype=np.float64)[-1])
+
+        delta = np.diff(close[-6:])
+        self.gains = np.where(delta > 0, delta, 0.0)   # 最後 5 天
+        self.losses = np.where(delta < 0, -delta, 0.0)
+        self.pcts = close[-20:][1:] / close[-20:][:-1] - 1  # 最後 19 天報酬率
+
+        row = close[None, :]
+        ema12 = ewm(row, span=12)[0]
+        ema26 = ewm(row, span=26)[0]
+        self.ema12 = ema12[-1]
+        self.ema26 = ema26[-1]
+        self.signal = ewm((ema12 - ema26)[None, :], span=9)[0, -1]
+
+        low_min = _rolling(row, 9, lambda v: v.min(axis=-1))
+        high_max = _rolling(row, 9, lambda v: v.max(axis=-1))
+        k = ewm((row - low_min) / (high_max - low_min + 1e-9) * 100, com=2)
+        self.k = k[0, -1]
+        self.d = ewm(k, com=2)[0, -1]
+
+    @classmethod
+    def from_history(cls, close, volume):
+        if len(close) < cls.WINDOW: return None
+        return cls(close, volume)
+
+    def peek(self, price, volume):
+        """以今日 (尚未收盤) 的價量算出當根特徵，不改動狀態"""
+        price = float(price)
+        f = {}
+        f["log_volume"] = np.log1p(volume)
+        f["pct_change"] = price / self.prev_close - 1
+
+        for w in [5, 20, 60]:
+            ma = (self.closes[-(w - 1):].sum() + price) / w
+            f[f"MA{w}"] = ma
+            f[f"Bias{w}"] = (price - ma) / (ma + 1e-9)
+
+        delta = price - self.prev_close
+        avg_gain = (self.gains.sum() + max(delta, 0.0)) / 6
+        avg_loss = (self.losses.sum() + max(-delta, 0.0)) / 6
+        rs = avg_gain / (avg_loss + 1e-9)
+        f["RSI6"] = 100 - (100 / (1 + rs))
+
+        a12, a26, a9 = 2 / 13, 2 / 27, 2 / 10
+        ema12 = (1 - a12) * self.ema12 + a12 * price
+        ema26 = (1 - a26) * self.ema26 + a26 * price
+        macd = ema12 - ema26
+        signal = (1 - a9) * self.signal + a9 * macd
+        f["MACD"] = macd
+        f["MACD_signal"] = signal
+        f["MACD_hist"] = macd - signal
+
+        last9 = np.append(self.closes[-8:], price)
+        low_min, high_max = last9.min(), last9.max()
+        rsv = (price - low_min) / (high_max - low_min + 1e-9) * 100
+        a3 = 1 / 3
+        k = (1 - a3) * self.k + a3 * rsv
+        f["K"] = k
+        f["D"] = (1 - a3) * self.d + a3 * k
+
+        bb_std = np.append(self.closes[-19:], price).std(ddof=1)
+        ma20 = f["MA20"]
+        f["BB_std"] = bb_std
+        f["BB_upper"] = ma20 + (bb_std * 2)
+        f["BB_lower"] = ma20 - (bb_std * 2)
+        f["BB_width"] = (f["BB_upper"] - f["BB_lower"]) / (ma20 + 1e-9)
+        f["Vol_20"] = np.append(self.pcts, f["pct_change"]).std(ddof=1)
+        return f
@@ -0,0 +1,125 @@
+# utils/finmind_gateway.py (Shared FinMind Gateway)
+import time
+import random
+import threading
+from collections import deque
+from FinMind.data import DataLoader as FinMindDataLoader
+from config.settings import Config
+from utils.rate_limiter import RateLimiter
+import colorama
+from colorama import Fore
+
+colorama.init(autoreset=True)
+
+class FinMindQuotaExceeded(Exception):
+    """重試後仍被 FinMind 限流 (402/429)"""
+
+class FinMindGateway:
+    """
+    全程序共用的 FinMind 入口 (DataLoader / ChipAgent / FundamentalAgent 共用)
+    1. 只登入一次
+    2. token bucket 限流：依方案的每小時請求數平均分配，允許小量突發
+    3. 402/429 (超過方案上限) 時指數退避重試，仍失敗則拋出 FinMindQuotaExceeded
+    4. 統計呼叫數、回傳資料量與本小時剩餘額度
+    用法與 FinMindDataLoader 相同：gateway.taiwan_stock_daily(...) 會自動經過限流與重試
+    """
+    def __init__(self):
+        self.api = FinMindDataLoader()
+        self.limiter = RateLimiter(Config.FINMIND_REQUESTS_PER_HOUR / 3600.0, Config.FINMIND_BURST)
+        self._lock = threading.Lock()
+        self._recent = deque() # 最近一小時的呼叫時間 (估算剩餘額度)
+        self.counters = {"calls": 0, "errors": 0, "rate_limited": 0, "retries": 0, "rows": 0, "bytes": 0}
+        self.server_usage = None
+        self._login()
+
+    def _login(self):
+        user = str(Config.FINMIND_USER).strip() if Config.FINMIND_USER else None
+        pwd = str(Config.FINMIND_PASS).strip() if Config.FINMIND_PASS else None
+        if not (user and pwd): return
+        try:
+            self.api.login(user_id=user, password=pwd)
+        except Exception as e:
+            print(f"{Fore.RED}[FinMind] 登入失敗: {e}")
+
+    @staticmethod
+    def _is_rate_limited(error):
+        text = str(error).replace(" ", "")
+        return '"status":402' in text or '"status":429' in text or "upperlimit" in text
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    def call(self, method, *args, **kwargs):
+        """經過限流與重試呼叫 FinMindDataLoader 的任一方法"""
+        fn = getattr(self.api, method)
+        for attempt in range(Config.FINMIND_MAX_RETRIES + 1):
+            self.limiter.acquire()
+            with self._lock:
+                self.counters["calls"] += 1
+                now = time.monotonic()
+                self._recent.append(now)
+                while self._recent and now - self._recent[0] > 3600: self._recent.popleft()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not self._is_rate_limited(e):
+                    self._count("errors")
+                    raise
+                self._count("rate_limited")
+                if attempt == Config.FINMIND_MAX_RETRIES:
+                    raise FinMindQuotaExceeded(f"{method}: {e}") from e
+                wait = Config.FINMIND_BACKOFF_BASE * (2 ** attempt) * (1 + random.random() * 0.2)
+                print(f"{Fore.YELLOW}[FinMind] 觸發限流，{wait:.1f} 秒後重試 ({attempt + 1}/{Config.FINMIND_MAX_RETRIES})")
+                self._count("retries")
+                time.sleep(wait)
+                continue
+
+            if hasattr(result, "memory_usage"):
+                self._count("rows", len(result))
+                self._count("bytes", int(result.memory_usage(index=False, deep=True).sum()))
+            return result
+
+    def __getattr__(self, name):
+        # 只代理 FinMind 的資料方法 (taiwan_stock_xxx 等)
+        if name.startswith("_") or not callable(getattr(self.api, name, None)):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+    def refresh_usage(self):
+        """向 FinMind 查詢本小時已用的請求數 (user_info)，失敗時保留本地估算"""
+        try:
+            self.server_usage = int(self.api.api_usage)
+        except Exception:
+            pass
+        return self.server_usage
+
+    def stats(self, refresh=False):
+        """呼叫統計 + 本小時剩餘額度 (優先用伺服器回報的用量，否則用本地近一小時呼叫數估算)"""
+        if refresh: self.refresh_usage()
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > 3600: self._recent.popleft()
+            out = dict(self.counters)
+            out["calls_last_hour"] = len(self._recent)
+        used = self.server_usage if self.server_usage is not None else out["calls_last_hour"]
+        out["quota_limit"] = Config.FINMIND_REQUESTS_PER_HOUR
+        out["quota_remaining"] = max(0, Config.FINMIND_REQUESTS_PER_HOUR - used)
+        return out
+
+    def report(self, refresh=False):
+        s = self.stats(refresh)
+        print(f"{Fore.CYAN}[FinMind] 呼叫 {s['calls']} 次 (限流 {s['rate_limited']} / 錯誤 {s['errors']}) | "
+              f"{s['rows']} 筆 {s['bytes'] / 1e6:.1f} MB | 本小時剩餘 {s['quota_remaining']}/{s['quota_limit']}")
+        return s
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_finmind():
+    """全程序共用的 FinMind gateway (只登入一次)"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = FinMindGateway()
+        return _gateway
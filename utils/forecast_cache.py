@@ -0,0 +1,89 @@
+# utils/forecast_cache.py
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from config.settings import Config
+import colorama
+from colorama import Fore
+
+colorama.init(autoreset=True)
+
+class ForecastCache:
+    """
+    TFT 推論結果快取 (兩層)
+    1. 記憶體 LRU：同一個交易時段內重複查詢只需一次 dict 查找
+    2. 選用的 SQLite 磁碟層：Streamlit 重啟後仍可沿用
+    key 由呼叫端組成 (stock_id | 最後 K 棒日期 | 收盤價 | 法人買賣超摘要 | 模型指紋)，換模型時 key 自然失效
+    """
+    def __init__(self, max_size=None, disk=None, db_name="forecast_cache.db"):
+        self.max_size = max_size or Config.FORECAST_CACHE_SIZE
+        self.disk = Config.FORECAST_CACHE_DISK if disk is None else disk
+        self.db_path = os.path.join(Config.DATA_DIR, db_name)
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        if self.disk: self._init_db()
+
+    def _get_conn(self):
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+
+    def _init_db(self):
+        try:
+            with self._get_conn() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS forecasts (
+                        key TEXT PRIMARY KEY,
+                        payload BLOB,
+                        created TEXT
+                    )
+                ''')
+                # 清掉過期的舊預測，避免檔案無限長大
+                expire = (datetime.now() - timedelta(days=Config.FORECAST_CACHE_TTL_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+                conn.execute("DELETE FROM forecasts WHERE created < ?", (expire,))
+        except Exception as e:
+            print(f"{Fore.RED}[Cache ERROR] 初始化失敗: {e}")
+            self.disk = False
+
+    def get(self, key):
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                return self._mem[key]
+
+        if not self.disk: return None
+        try:
+            with self._get_conn() as conn:
+                row = conn.execute("SELECT payload FROM forecasts WHERE key = ?", (key,)).fetchone()
+        except Exception:
+            return None
+        if row is None: return None
+
+        value = pickle.loads(row[0])
+        self._put_mem(key, value)
+        return value
+
+    def put(self, key, value):
+        self._put_mem(key, value)
+        if not self.disk: return
+        try:
+            with self._get_conn() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO forecasts (key, payload, created) VALUES (?, ?, ?)",
+                    (key, pickle.dumps(value), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                )
+        except Exception as e:
+            print(f"{Fore.RED}[Cache ERROR] 寫入失敗: {e}")
+
+    def _put_mem(self, key, value):
+        with self._lock:
+            self._mem[key] = value
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_size:
+                self._mem.popitem(last=False)
+
+    def clear(self):
+        """只清記憶體層；磁碟層的 key 含模型指紋，換模型後不會再命中"""
+        with self._lock:
+            self._mem.clear()
@@ -0,0 +1,38 @@
+# utils/html_extract.py (Lightweight HTML Extraction)
+import re
+from html import unescape
+
+# Yahoo 頁面動輒數百 KB，只為了讀一個 meta 或幾十個連結不值得建整棵 DOM
+# 以下正規式預先編譯，直接在原始 HTML 字串上掃描
+_META_TAG = re.compile(r'<meta\b[^>]*?\bproperty\s*=\s*["\']og:description["\'][^>]*>', re.I)
+_CONTENT_ATTR = re.compile(r'\bcontent\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', re.I)
+_ANCHOR_HREF = re.compile(r'<a\b[^>]*?\bhref\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', re.I)
+# TWO 必須先試，且後面不能再接英數字，否則 6488.TWO 會被截成 TW
+_QUOTE_LINK = re.compile(r'/quote/(\d+)\.(TWO|TW)(?![A-Za-z0-9])')
+_PRICE = re.compile(r'成交價\s*([\d,]+\.?\d*)')
+
+def og_description(html):
+    """<meta property="og:description" content="..."> 的 content (已解 HTML entity)，沒有回傳 None"""
+    tag = _META_TAG.search(html)
+    if not tag: return None
+    attr = _CONTENT_ATTR.search(tag.group(0))
+    if not attr: return ""
+    return unescape(attr.group(1) if attr.group(1) is not None else attr.group(2))
+
+def quote_price(html):
+    """Yahoo 個股頁的成交價；查無此股或解析不到回傳 None"""
+    content = og_description(html)
+    if not content or "查無" in content: return None
+    match = _PRICE.search(content)
+    if not match: return None
+    price = float(match.group(1).replace(',', ''))
+    return price if price > 0 else None
+
+def quote_links(html):
+    """頁面上所有 /quote/XXXX.TW(O) 連結 -> [(stock_id, exchange)]，依出現順序 (含重複)"""
+    out = []
+    for m in _ANCHOR_HREF.finditer(html):
+        href = unescape(m.group(1) if m.group(1) is not None else m.group(2))
+        link = _QUOTE_LINK.search(href)
+        if link: out.append((link.group(1), link.group(2)))
+    return out
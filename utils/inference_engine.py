@@ -0,0 +1,44 @@
+# utils/inference_engine.py
+import torch
+from torch.utils.data import ConcatDataset, DataLoader as TorchDataLoader
+from pytorch_forecasting import TimeSeriesDataSet
+from config.settings import Config
+
+class TFTInferenceEngine:
+    """
+    不經過 pl.Trainer 的 TFT 推論引擎
+    自行 collate batch 後直接呼叫 network.forward，不建 Trainer / logger / checkpoint，
+    因此推論時不會再產生 lightning_logs/version_N 資料夾
+    """
+    def __init__(self, model, device="cpu", batch_size=None):
+        self.model = model
+        self.device = device
+        self.batch_size = batch_size or Config.INFERENCE_BATCH_SIZE
+
+    def _to_device(self, obj):
+        """x 是巢狀的 dict / list / tensor，逐層搬到推論裝置上"""
+        if isinstance(obj, torch.Tensor):
+            return obj.to(self.device, non_blocking=True)
+        if isinstance(obj, dict):
+            return {k: self._to_device(v) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return type(obj)(self._to_device(v) for v in obj)
+        return obj
+
+    def predict(self, datasets):
+        """
+        datasets: predict=True 的 TimeSeriesDataSet 清單 (每個只含一筆預測樣本)
+        回傳與 datasets 順序對齊、已還原尺度的 prediction tensor (N, PREDICTION_DAYS, 7)，位於 CPU
+        """
+        dl = TorchDataLoader(
+            ConcatDataset(datasets), batch_size=self.batch_size, shuffle=False,
+            collate_fn=TimeSeriesDataSet._collate_fn, num_workers=0
+        )
+        outputs = []
+        self.model.eval()
+        with torch.inference_mode():
+            for x, _ in dl:
+                # TFT.forward 內部已經用 target_scale 做過 transform_output，等同 predict(mode="raw")
+                out = self.model(self._to_device(x))
+                outputs.append(out["prediction"].detach().cpu())
+        return torch.cat(outputs, dim=0)
@@ -0,0 +1,196 @@
+# utils/panel_cache.py (Memory-Mapped Feature Panel)
+import os
+import json
+import numpy as np
+import pandas as pd
+from config.settings import Config
+from utils.features import compute_feature_block, _stack, _fill, FEATURE_COLUMNS
+import colorama
+from colorama import Fore
+
+colorama.init(autoreset=True)
+
+class PanelCache:
+    """
+    訓練宇宙的特徵面板，落地成 float32 的 .npy 並以 memmap 讀取
+    panel: (tickers, days, features)，days 是全宇宙的交易日聯集，該股當天沒資料就整列 NaN
+    index: 同名 _index.json，記錄 tickers / dates / columns 與目前已寫入的天數
+    天數軸預留 DAY_CHUNK 的空間，新交易日直接寫進預留區，不必整檔改寫
+    最後 PANEL_REWRITE_DAYS 個交易日每次 sync 都重算重寫，DB 後來修正的收盤/成交量才會反映進來
+    """
+    RAW_COLUMNS = ['Close', 'Volume', 'Foreign_BuySell', 'Trust_BuySell']
+    # 法人資料可能在日K入庫之後才回補，每次 sync 都整段重寫 (沒有特徵依賴它們，成本很低)
+    FLOW_COLUMNS = ['Foreign_BuySell', 'Trust_BuySell']
+    COLUMNS = RAW_COLUMNS + FEATURE_COLUMNS
+    DAY_CHUNK = 256
+
+    def __init__(self, name="universe"):
+        base = os.path.join(Config.DATA_DIR, "panel")
+        os.makedirs(base, exist_ok=True)
+        self.path = os.path.join(base, f"{name}.npy")
+        self.index_path = os.path.join(base, f"{name}_index.json")
+        self.tickers = []
+        self.dates = np.array([], dtype='datetime64[D]')
+        self._load_index()
+
+    def _load_index(self):
+        if not (os.path.exists(self.path) and os.path.exists(self.index_path)): return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        # 欄位定義變了 (例如新增特徵) 就當作沒有快取，下次 sync 會整個重建
+        if index.get("columns") != self.COLUMNS: return
+        self.tickers = index["tickers"]
+        self.dates = np.array(index["dates"], dtype='datetime64[D]')
+
+    def _save_index(self):
+        index = {
+            "tickers": self.tickers,
+            "dates": [str(d) for d in self.dates],
+            "columns": self.COLUMNS,
+        }
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp, self.index_path)
+
+    @property
+    def n_days(self):
+        return len(self.dates)
+
+    def _capacity(self, n_days):
+        return (n_days // self.DAY_CHUNK + 1) * self.DAY_CHUNK
+
+    def open(self, mode='r'):
+        """回傳 memmap (含預留區)，有效範圍是 [:, :n_days]"""
+        return np.load(self.path, mmap_mode=mode)
+
+    def panel(self):
+        return self.open()[:, :self.n_days]
+
+    def _compute(self, raw, tickers):
+        """整批算出原始欄位 + 特徵 (右對齊堆疊，與 add_features_many 的補值規則相同)"""
+        frames = [raw[t] for t in tickers]
+        block = compute_feature_block(_stack(frames, "Close"), _stack(frames, "Volume"), [len(df) for df in frames])
+        cols = {c: _fill(_stack(frames, c)) for c in self.RAW_COLUMNS}
+        cols.update({c: _fill(block[c]) for c in FEATURE_COLUMNS})
+        width = cols["Close"].shape[1]
+        dates = [pd.to_datetime(df['date']).to_numpy().astype('datetime64[D]') for df in frames]
+        return cols, width, dates
+
+    def _write(self, arr, cols, width, dates, calendar, since=None):
+        """把每檔的序列依日期散佈到 calendar 上；since[i] 有值時只寫入該檔最後已寫入日期之後的資料"""
+        for i, d in enumerate(dates):
+            if not len(d): continue
+            vals = np.stack([cols[c][i, width - len(d):] for c in self.COLUMNS], axis=1)
+            keep = d > since[i] if since is not None else slice(None)
+            arr[i, np.searchsorted(calendar, d[keep])] = vals[keep]
+
+    def _build(self, raw, tickers, calendar):
+        print(f"{Fore.YELLOW}[Panel] 建立特徵面板: {len(tickers)} 檔 x {len(calendar)} 天")
+        cols, width, dates = self._compute(raw, tickers)
+        tmp = self.path + ".tmp.npy"
+        shape = (len(tickers), self._capacity(len(calendar)), len(self.COLUMNS))
+        arr = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32, shape=shape)
+        arr[:] = np.nan
+        self._write(arr, cols, width, dates, calendar)
+        arr.flush()
+        del arr
+        os.replace(tmp, self.path)
+        self.tickers = list(tickers)
+        self.dates = calendar
+        self._save_index()
+
+    def _grow(self, n_days):
+        """預留區用完時才整檔改寫成更大的天數容量"""
+        old = self.open()
+        tmp = self.path + ".tmp.npy"
+        shape = (old.shape[0], self._capacity(n_days), old.shape[2])
+        arr = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32, shape=shape)
+        arr[:] = np.nan
+        for i in range(old.shape[0]):
+            arr[i, :self.n_days] = old[i, :self.n_days]
+        arr.flush()
+        del arr, old
+        os.replace(tmp, self.path)
+
+    def _append(self, raw, new_dates):
+        if len(new_dates):
+            print(f"{Fore.YELLOW}[Panel] 追加 {len(new_dates)} 個新交易日 (自 {new_dates[0]})")
+        calendar = np.concatenate([self.dates, new_dates])
+        if len(calendar) > self.open().shape[1]:
+            self._grow(len(calendar))
+        # EWM 類特徵依賴完整歷史，仍以整段序列計算，但只寫入尾段重寫窗與各檔尚未寫入的日期
+        cols, width, dates = self._compute(raw, self.tickers)
+        arr = self.open('r+')
+        valid = ~np.isnan(arr[:, :self.n_days, 0])
+        last = self.n_days - 1 - np.argmax(valid[:, ::-1], axis=1)
+        # 整段都沒資料的股票從頭寫入
+        since = np.where(valid.any(axis=1), self.dates[last], np.datetime64('1900-01-01', 'D'))
+        keep = self.n_days - Config.PANEL_REWRITE_DAYS
+        if keep > 0:
+            since = np.minimum(since, self.dates[keep - 1])
+        else:
+            since[:] = np.datetime64('1900-01-01', 'D')
+        # 重寫窗先清空，DB 已刪掉的日期才不會殘留舊值
+        arr[:, max(keep, 0):self.n_days] = np.nan
+        self._write(arr, cols, width, dates, calendar, since=since)
+        arr.flush()
+        del arr
+        self.dates = calendar
+        self._save_index()
+
+    def _sync_flows(self, raw):
+        frames = [raw[t] for t in self.tickers]
+        idx = [self.COLUMNS.index(c) for c in self.FLOW_COLUMNS]
+        vals = np.stack([_fill(_stack(frames, c)) for c in self.FLOW_COLUMNS], axis=2)
+        width = vals.shape[1]
+        arr = self.open('r+')
+        for i, df in enumerate(frames):
+            if not len(df): continue
+            d = pd.to_datetime(df['date']).to_numpy().astype('datetime64[D]')
+            pos = np.searchsorted(self.dates, d)
+            arr[i, pos[:, None], idx] = vals[i, width - len(d):]
+        arr.flush()
+        del arr
+
+    def sync(self, raw, rebuild=False):
+        """
+        raw: {stock_id: 原始日K df}
+        宇宙不變時只追加新交易日並重寫尾段；宇宙變動、欄位變動或 rebuild=True 時整個重建
+        """
+        tickers = sorted(str(t) for t in raw)
+        raw = {str(t): df for t, df in raw.items()}
+        calendar = np.unique(np.concatenate([
+            pd.to_datetime(df['date']).to_numpy().astype('datetime64[D]') for df in raw.values()
+        ]))
+
+        # 舊日期區間冒出面板沒有的交易日 (補檔) 就無法只追加，改為重建
+        if not (rebuild or tickers != self.tickers or not self.n_days):
+            rebuild = len(np.setdiff1d(calendar[calendar <= self.dates[-1]], self.dates)) > 0
+        if rebuild or tickers != self.tickers or not self.n_days:
+            self._build(raw, tickers, calendar)
+            return
+        new_dates = calendar[calendar > self.dates[-1]]
+        if not len(new_dates):
+            print(f"{Fore.CYAN}[Panel] 特徵面板已是最新 ({self.dates[-1]})，重寫最後 {Config.PANEL_REWRITE_DAYS} 個交易日")
+        self._append(raw, new_dates)
+        self._sync_flows(raw)
+
+    def to_frame(self):
+        """
+        攤平成 TimeSeriesDataSet 需要的長表
+        直接從 memmap 取有效列，不再逐檔建立 DataFrame 再 concat
+        """
+        arr = self.panel()
+        tix, dix = np.nonzero(~np.isnan(arr[:, :, 0]))
+        data = pd.DataFrame(arr[tix, dix], columns=self.COLUMNS)
+        tickers = np.array(self.tickers)
+        dates = pd.to_datetime(self.dates[dix])
+        data.insert(0, 'date', dates)
+        data.insert(1, 'stock_id', tickers[tix])
+        data['time_idx'] = (dates - pd.Timestamp(Config.START_DATE)).days.astype(np.int64)
+        data['group_id'] = data['stock_id'].astype(str)
+        return data
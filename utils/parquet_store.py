@@ -0,0 +1,206 @@
+# utils/parquet_store.py (Columnar Bars Store)
+import sys
+import os
+
+# --- 🚑 路徑急救包 (支援 python utils/parquet_store.py migrate) ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+# -------------------
+
+import json
+import threading
+import numpy as np
+import pandas as pd
+from config.settings import Config
+import colorama
+from colorama import Fore
+
+# pyarrow 為選用依賴，只有啟用 Parquet 後端時才需要
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+colorama.init(autoreset=True)
+
+class ParquetStore:
+    """
+    日K 的欄式儲存，與 SQLite 並存
+    目錄結構: data/parquet/stock_id=XXXX/bars.parquet (hive 分區，每檔一個檔案)
+    讀取全宇宙時由 pyarrow 一次掃描所有分區，數值欄位直接轉成 NumPy
+    _migrated.json 記錄 migrate_from_sqlite 已完整搬過的股票；其他股票的分區可能只有雙寫進來的增量
+    """
+    def __init__(self, root=None, value_columns=None):
+        if pa is None:
+            raise ImportError("Parquet 儲存後端需要 pyarrow (pip install pyarrow)")
+        self.root = root or os.path.join(Config.DATA_DIR, "parquet")
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        # 底線開頭的檔案 pyarrow 掃描時會略過，不會被當成分區資料
+        self._manifest_path = os.path.join(self.root, "_migrated.json")
+        self._manifest = (None, frozenset()) # (檔案 mtime, 已遷移的 stock_id)
+        # stock_id 一律當字串，避免 0050 之類的代號被推斷成整數
+        self._partitioning = ds.partitioning(pa.schema([("stock_id", pa.string())]), flavor="hive")
+        # 指定欄位時以固定 schema 掃描：新增欄位前寫入的舊檔缺的欄位讀成 null，而不是依第一個檔案推斷
+        self.value_columns = list(value_columns) if value_columns else None
+        self._schema = None
+        if self.value_columns:
+            self._schema = pa.schema(
+                [("date", pa.timestamp("ns"))] + [(c, pa.float64()) for c in self.value_columns] + [("stock_id", pa.string())]
+            )
+
+    def migrated(self):
+        """已完整遷移的 stock_id 集合 (清單檔有變動才重讀，其他程序完成遷移也看得到)"""
+        try:
+            mtime = os.path.getmtime(self._manifest_path)
+        except OSError:
+            return frozenset()
+        if self._manifest[0] != mtime:
+            try:
+                with open(self._manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = (mtime, frozenset(json.load(f)))
+            except (OSError, ValueError):
+                return self._manifest[1]
+        return self._manifest[1]
+
+    def _mark_migrated(self, stock_ids):
+        with self._lock:
+            done = sorted(self.migrated() | {str(s) for s in stock_ids})
+            tmp = self._manifest_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(done, f)
+            os.replace(tmp, self._manifest_path)
+
+    def _path(self, stock_id):
+        return os.path.join(self.root, f"stock_id={stock_id}", "bars.parquet")
+
+    def _rewrite(self, df, path):
+        # 數值欄一律存 float64，各分區 schema 一致，dataset 才能一次掃描
+        value_cols = [c for c in df.columns if c != 'date']
+        df[value_cols] = df[value_cols].astype('float64')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp)
+        os.replace(tmp, path)
+
+    def write(self, df, stock_id, preserve=(), coalesce=()):
+        """
+        upsert：與既有檔案合併 (同日期以新資料為準) 後整檔改寫
+        preserve 中的欄位在既有日期上沿用舊值 (例如日K更新時不覆蓋已回補的法人資料)
+        coalesce 中的欄位只有新值為 NaN 時才沿用舊值
+        """
+        if df is None or df.empty: return
+        stock_id = str(stock_id)
+        new = df.drop(columns=['stock_id'], errors='ignore').copy()
+        new['date'] = pd.to_datetime(new['date'])
+        path = self._path(stock_id)
+
+        with self._lock:
+            if os.path.exists(path):
+                old = pq.read_table(path).to_pandas()
+                keep = [c for c in preserve if c in old.columns and c in new.columns]
+                fill = [c for c in coalesce if c in old.columns and c in new.columns]
+                if keep or fill:
+                    prev = old.drop_duplicates(subset='date', keep='last').set_index('date')
+                    hit = new['date'].isin(prev.index).to_numpy()
+                    dates = new.loc[hit, 'date']
+                    if keep:
+                        new.loc[hit, keep] = prev.loc[dates, keep].to_numpy()
+                    if fill:
+                        cur = new.loc[hit, fill]
+                        new.loc[hit, fill] = cur.where(cur.notna(), prev.loc[dates, fill].to_numpy()).to_numpy()
+                new = pd.concat([old, new], ignore_index=True)
+            new = new.drop_duplicates(subset='date', keep='last').sort_values('date', ignore_index=True)
+            self._rewrite(new, path)
+
+    def update(self, df, stock_id):
+        """只更新既有日期上 df 帶來的欄位 (不新增日期)"""
+        if df is None or df.empty: return
+        path = self._path(str(stock_id))
+        new = df.drop(columns=['stock_id'], errors='ignore').copy()
+        new['date'] = pd.to_datetime(new['date'])
+
+        with self._lock:
+            if not os.path.exists(path): return
+            old = pq.read_table(path).to_pandas().set_index('date')
+            old.update(new.drop_duplicates(subset='date', keep='last').set_index('date'))
+            self._rewrite(old.reset_index(), path)
+
+    def _scan(self, stock_ids, start_date=None, end_date=None):
+        if not os.listdir(self.root): return None
+        dataset = ds.dataset(self.root, format="parquet", partitioning=self._partitioning, schema=self._schema)
+        filt = ds.field("stock_id").isin([str(s) for s in stock_ids])
+        if start_date: filt = filt & (ds.field("date") >= pa.scalar(pd.Timestamp(start_date).to_datetime64()))
+        if end_date: filt = filt & (ds.field("date") <= pa.scalar(pd.Timestamp(end_date).to_datetime64()))
+        table = dataset.to_table(filter=filt)
+        return table.sort_by([("stock_id", "ascending"), ("date", "ascending")]).combine_chunks()
+
+    def load(self, stock_id, start_date=None, end_date=None):
+        df = self.load_many([stock_id], start_date, end_date)
+        return df.reset_index(drop=True)
+
+    def load_many(self, stock_ids, start_date=None, end_date=None, as_arrays=False):
+        """
+        與 DBManager.load_many 相同的介面
+        as_arrays=True 時回傳 {stock_id: {欄位: np.ndarray}}，無缺值的數值欄位以 zero-copy 轉換
+        """
+        table = self._scan(stock_ids, start_date, end_date)
+        if table is None or table.num_rows == 0:
+            return {} if as_arrays else pd.DataFrame(columns=['date', 'stock_id'])
+
+        if not as_arrays:
+            df = table.to_pandas()
+            front = ['date', 'stock_id']
+            return df[front + [c for c in df.columns if c not in front]]
+
+        columns = {}
+        for name in table.column_names:
+            col = table.column(name)
+            chunk = col.chunk(0) if col.num_chunks == 1 else col.combine_chunks()
+            try:
+                columns[name] = chunk.to_numpy(zero_copy_only=True)
+            except (pa.ArrowInvalid, NotImplementedError):
+                columns[name] = chunk.to_numpy(zero_copy_only=False)
+
+        ids = columns.pop('stock_id')
+        uniq, starts = np.unique(ids, return_index=True)
+        bounds = np.append(starts, len(ids))
+        return {
+            stock_id: {c: v[bounds[j]:bounds[j + 1]] for c, v in columns.items()}
+            for j, stock_id in enumerate(uniq)
+        }
+
+    def migrate_from_sqlite(self, db):
+        """把既有 market_data.db 的 daily_metrics 全部搬進 Parquet，每搬完一批就記進遷移清單"""
+        stock_ids = [r[0] for r in db._get_conn().execute("SELECT DISTINCT stock_id FROM daily_metrics").fetchall()]
+        print(f"{Fore.YELLOW}[Parquet] 開始遷移 {len(stock_ids)} 檔股票...")
+        for i in range(0, len(stock_ids), 200):
+            chunk = stock_ids[i:i + 200]
+            for stock_id, df in db.split_many(db.load_many(chunk, use_columnar=False)).items():
+                self.write(df, stock_id)
+            self._mark_migrated(chunk)
+        print(f"{Fore.GREEN}[Parquet] 遷移完成 -> {self.root}")
+
+# 同一個目錄全程序共用一個 store：寫入鎖是每個 store 一把，各自建立就無法互斥 (scanner / trainer / app 會互相蓋掉)
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_parquet_store(root=None, value_columns=None):
+    """依目錄取得共用的 ParquetStore (第一次呼叫時建立)"""
+    root = os.path.abspath(root or os.path.join(Config.DATA_DIR, "parquet"))
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = _stores[root] = ParquetStore(root, value_columns)
+        return store
+
+if __name__ == "__main__":
+    from utils.db_manager import DBManager
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        get_parquet_store(value_columns=DBManager.VALUE_COLUMNS).migrate_from_sqlite(DBManager())
+    else:
+        print("用法: python utils/parquet_store.py migrate")
@@ -0,0 +1,44 @@
+# utils/rate_limiter.py
+import threading
+import time
+from config.settings import Config
+
+class RateLimiter:
+    """
+    執行緒安全的 token bucket
+    rate: 每秒補充幾個 token；burst: 最多累積幾個 (允許短時間的突發請求)
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self):
+        """取得一個 token，不夠時睡到補滿為止"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+# 每個資料源全程序只有一個 bucket：各 DataLoader / 報價服務各自建立的話，上限會隨實例數倍增
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(name):
+    """依 Config.RATE_LIMITS 取得該資料源共用的限流器"""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = _limiters[name] = RateLimiter(*Config.RATE_LIMITS[name])
+        return limiter
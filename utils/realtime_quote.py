@@ -0,0 +1,219 @@
+# utils/realtime_quote.py (Pooled Realtime Quote Service)
+import time
+import threading
+import requests
+import yfinance as yf
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import Config
+from utils.rate_limiter import get_limiter
+from utils.symbol_index import get_symbol_index
+from utils.html_extract import quote_price
+
+_MISS = object()
+
+class RealtimeQuoteService:
+    """
+    盤中即時報價 (全程序共用一個實例，請用 get_quote_service() 取得)
+    1. 證交所 MIS 批次報價：一個請求帶回 N 檔，上市/上櫃一起查
+    2. 查不到的才逐檔走 Yahoo 頁面，最後才是 yfinance
+    每檔的交易所 (TW / TWO) 先查 SymbolIndex，查到一次就回填，之後不再先打錯的那邊
+    報價在 QUOTE_CACHE_TTL 秒內共用，多個 Agent 同時詢問同一檔只會發一次請求
+    """
+    MIS_URL = "https://mis.twse.com.tw/stock/api/getStockInfo.jsp"
+    YAHOO_URL = "https://tw.stock.yahoo.com/quote/{stock_id}.{exchange}"
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+    }
+    MIS_BATCH = 50  # 每個 MIS 請求最多帶幾檔 (URL 長度限制)
+    MIS_PREFIX = {"TW": "tse", "TWO": "otc"}
+
+    def __init__(self, ttl=None, timeout=3):
+        self.ttl = Config.QUOTE_CACHE_TTL if ttl is None else ttl
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(self.HEADERS)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=Config.SCAN_WORKERS * 2)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.limiters = {name: get_limiter(name) for name in ("mis", "yahoo", "yfinance")}
+
+        self.symbols = get_symbol_index()
+        self._cache = {}     # stock_id -> (查詢時間, 價格)
+        self._rows = {}      # stock_id -> 最近一次 MIS 原始欄位 (漲停價 u / 昨收 y 等)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._mis_ready = False
+
+    # --- 快取 ---
+    def _cached(self, stock_id):
+        """TTL 內的報價 (查不到的 None 也會快取，避免失敗的股票被反覆重試)；過期回傳 _MISS"""
+        with self._lock:
+            hit = self._cache.get(stock_id)
+        if hit and time.monotonic() - hit[0] < self.ttl: return hit[1]
+        return _MISS
+
+    def _store(self, stock_id, price):
+        with self._lock:
+            self._cache[stock_id] = (time.monotonic(), price)
+
+    def _key_lock(self, stock_id):
+        with self._lock:
+            return self._key_locks.setdefault(stock_id, threading.Lock())
+
+    def _exchange_order(self, stock_id):
+        """已知交易所的只查那一個；未知時沿用舊順序 (上櫃先)"""
+        return self.symbols.exchange_order(stock_id)
+
+    # --- 資料源 ---
+    def _fetch_mis(self, stock_ids):
+        """證交所 MIS 批次報價 -> {stock_id: price}；未知交易所的股票上市/上櫃各帶一次"""
+        if not self._mis_ready:
+            # MIS 需要先拿到 session cookie
+            try: self.session.get("https://mis.twse.com.tw/stock/index.jsp", timeout=self.timeout)
+            except requests.RequestException: pass
+            self._mis_ready = True
+
+        channels = []
+        for stock_id in stock_ids:
+            for exchange in self._exchange_order(stock_id):
+                channels.append(f"{self.MIS_PREFIX[exchange]}_{stock_id}.tw")
+
+        prices = {}
+        for i in range(0, len(channels), self.MIS_BATCH):
+            self.limiters["mis"].acquire()
+            try:
+                res = self.session.get(self.MIS_URL, timeout=self.timeout, params={
+                    "ex_ch": "|".join(channels[i:i + self.MIS_BATCH]), "json": 1, "delay": 0,
+                })
+                if res.status_code != 200: continue
+                rows = res.json().get("msgArray", [])
+            except (requests.RequestException, ValueError):
+                continue
+
+            for row in rows:
+                stock_id = row.get("c")
+                price = self._parse_mis_price(row)
+                if not stock_id or price is None: continue
+                prices[stock_id] = price
+                with self._lock:
+                    self._rows[stock_id] = row
+                self.symbols.remember(stock_id, "TW" if row.get("ex") == "tse" else "TWO")
+        return prices
+
+    @staticmethod
+    def _parse_mis_price(row):
+        # z = 最近成交價；尚未成交時為 "-"，改用最佳買價
+        for value in (row.get("z"), (row.get("b") or "").split("_")[0]):
+            try:
+                price = float(value)
+                if price > 0: return price
+            except (TypeError, ValueError):
+                pass
+        return None
+
+    def _fetch_yahoo(self, stock_id):
+        for exchange in self._exchange_order(stock_id):
+            self.limiters["yahoo"].acquire()
+            try:
+                res = self.session.get(self.YAHOO_URL.format(stock_id=stock_id, exchange=exchange), timeout=self.timeout)
+            except requests.RequestException:
+                continue
+            if res.status_code != 200: continue
+
+            price = quote_price(res.text)
+            if price is not None:
+                self.symbols.remember(stock_id, exchange)
+                return price
+        return None
+
+    def _fetch_yfinance(self, stock_id):
+        for exchange in self.symbols.exchange_order(stock_id, default=('TW', 'TWO')):
+            self.limiters["yfinance"].acquire()
+            ticker = yf.Ticker(f"{stock_id}.{exchange}")
+            price = None
+            try:
+                if hasattr(ticker, 'fast_info'):
+                    price = ticker.fast_info.last_price
+            except: pass
+
+            if not (price and price > 0):
+                try:
+                    df_rt = ticker.history(period="1d", interval="1m")
+                    if not df_rt.empty: price = df_rt['Close'].iloc[-1]
+                except: pass
+
+            if price and price > 0:
+                self.symbols.remember(stock_id, exchange)
+                return price
+        return None
+
+    def _fetch_single(self, stock_id):
+        """MIS 沒給價時的逐檔備援：Yahoo -> yfinance"""
+        try:
+            price = self._fetch_yahoo(stock_id)
+            if price is None: price = self._fetch_yfinance(stock_id)
+        except Exception:
+            price = None
+        self._store(stock_id, price)
+        return price
+
+    # --- 對外介面 ---
+    def get(self, stock_id):
+        stock_id = str(stock_id)
+        price = self._cached(stock_id)
+        if price is not _MISS: return price
+        # 同一檔同時只允許一個請求在飛，其他人等它寫入快取後直接共用
+        with self._key_lock(stock_id):
+            price = self._cached(stock_id)
+            if price is not _MISS: return price
+            return self.get_many([stock_id], workers=1)[stock_id]
+
+    def get_many(self, stock_ids, workers=None):
+        """批次報價 -> {stock_id: price 或 None}"""
+        stock_ids = [str(s) for s in stock_ids]
+        result = {stock_id: self._cached(stock_id) for stock_id in stock_ids}
+        missing = [s for s, p in result.items() if p is _MISS]
+        if not missing: return result
+
+        try:
+            fetched = self._fetch_mis(missing)
+        except Exception:
+            fetched = {}
+        for stock_id, price in fetched.items():
+            self._store(stock_id, price)
+            result[stock_id] = price
+
+        rest = [s for s in missing if result[s] is _MISS]
+        if rest:
+            workers = min(workers or Config.SCAN_WORKERS, len(rest))
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    result.update(zip(rest, pool.map(self._fetch_single, rest)))
+            else:
+                result.update((s, self._fetch_single(s)) for s in rest)
+        return result
+
+    def limit_up(self, stock_ids):
+        """目前成交價已觸及漲停價 (MIS 的 u 欄位) 的股票，依傳入順序"""
+        prices = self.get_many(stock_ids)
+        hits = []
+        for stock_id, price in prices.items():
+            with self._lock:
+                row = self._rows.get(stock_id)
+            try:
+                if price and row and price >= float(row.get("u")): hits.append(stock_id)
+            except (TypeError, ValueError):
+                pass
+        return hits
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_quote_service():
+    """全程序共用的報價服務 (多個 DataLoader / Agent 共享連線池與快取)"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = RealtimeQuoteService()
+        return _service
@@ -0,0 +1,110 @@
+# utils/symbol_index.py (Ticker -> Exchange Resolution Index)
+import threading
+from datetime import date, datetime, timedelta
+from config.settings import Config
+from utils.db_manager import DBManager
+import colorama
+from colorama import Fore
+
+colorama.init(autoreset=True)
+
+class SymbolIndex:
+    """
+    代號對照表 (持久化在 market_data.db 的 symbols 表)
+    exchange: TW (上市) / TWO (上櫃、興櫃)；board: 上市/上櫃/興櫃
+    status: listed / unknown；instrument: stock / etf / warrant / index
+    來源有二：FinMind 股票總表的批次匯入，以及任何一次成功查價後回填的交易所
+    所有抓資料的路徑都先查這裡，知道交易所就只打那一個
+    """
+    # FinMind TaiwanStockInfo 的 type -> (交易所後綴, 市場別)
+    BOARDS = {"twse": ("TW", "上市"), "tpex": ("TWO", "上櫃"), "emerging": ("TWO", "興櫃")}
+
+    def __init__(self, db=None):
+        self.db = db or DBManager()
+        self._lock = threading.Lock()
+        self._symbols = self.db.load_symbols()
+        self._refresh_attempted = False
+
+    def get(self, stock_id):
+        return self._symbols.get(str(stock_id))
+
+    def exchange(self, stock_id):
+        info = self.get(stock_id)
+        return info.get("exchange") if info else None
+
+    def exchange_order(self, stock_id, default=('TWO', 'TW')):
+        """已知交易所只回傳那一個，未知時回傳呼叫端原本的探測順序"""
+        known = self.exchange(stock_id)
+        return [known] if known else list(default)
+
+    def remember(self, stock_id, exchange, **meta):
+        """查價成功後回填交易所；已知且相同時不寫 DB"""
+        stock_id = str(stock_id)
+        with self._lock:
+            info = self._symbols.get(stock_id)
+            if info and info.get("exchange") == exchange and not meta: return
+            record = {"stock_id": stock_id, "exchange": exchange, "updated": date.today().isoformat(), **meta}
+            merged = dict(info or {})
+            merged.update({k: v for k, v in record.items() if v is not None})
+            self._symbols[stock_id] = merged
+        self.db.save_symbols([record])
+
+    @staticmethod
+    def _instrument(stock_id, industry):
+        industry = industry or ""
+        if "ETF" in industry or "ETN" in industry or stock_id.startswith("00"): return "etf"
+        if "權證" in industry or (len(stock_id) == 6 and stock_id[0] == "0" and stock_id[1] in "3456789"): return "warrant"
+        if industry == "Index" or not stock_id[:1].isdigit(): return "index"
+        return "stock"
+
+    def refresh_from_finmind(self, api):
+        """FinMind 股票總表一次匯入全市場 (一個 API 請求，限流由 gateway 處理)"""
+        info = api.taiwan_stock_info()
+        if info is None or info.empty: return 0
+
+        today = date.today().isoformat()
+        info = info.sort_values("date").drop_duplicates(subset="stock_id", keep="last")
+        records = []
+        for row in info.itertuples(index=False):
+            board = self.BOARDS.get(getattr(row, "type", None))
+            if board is None: continue
+            stock_id = str(row.stock_id)
+            records.append({
+                "stock_id": stock_id, "exchange": board[0], "board": board[1], "status": "listed",
+                "instrument": self._instrument(stock_id, getattr(row, "industry_category", "")),
+                "name": getattr(row, "stock_name", None), "updated": today,
+            })
+
+        self.db.save_symbols(records)
+        with self._lock:
+            self._symbols = self.db.load_symbols()
+        print(f"{Fore.CYAN}[Symbols] 已匯入 {len(records)} 檔代號對照")
+        return len(records)
+
+    def is_stale(self):
+        """批次匯入的資料 (有 board 的那些) 超過 SYMBOL_INDEX_REFRESH_DAYS 天視為過期"""
+        stamps = [s["updated"] for s in self._symbols.values() if s.get("board") and s.get("updated")]
+        if not stamps: return True
+        last = datetime.strptime(max(stamps), "%Y-%m-%d").date()
+        return date.today() - last > timedelta(days=Config.SYMBOL_INDEX_REFRESH_DAYS)
+
+    def ensure_fresh(self, api):
+        """過期才重新匯入；每個程序只嘗試一次，FinMind 失敗時沿用查價回填的結果"""
+        with self._lock:
+            if self._refresh_attempted or not self.is_stale(): return
+            self._refresh_attempted = True
+        try:
+            self.refresh_from_finmind(api)
+        except Exception as e:
+            print(f"{Fore.YELLOW}[Symbols] 代號總表匯入失敗，改用查價回填: {e}")
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_symbol_index():
+    """全程序共用的代號對照表"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SymbolIndex()
+        return _index